@@ -0,0 +1,55 @@
+'''
+## muzi 导入耗时基准
+
+~~~
+python benchmarks/import_time.py [-n 20] [--max 150] [--module muzi]
+~~~
+
+* 每次在新的解释器中导入, 输出耗时的中位数与最慢的模块
+* 指定`--max`(毫秒)时, 中位数超过该值将以非零状态退出, 可用于防止回退
+'''
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(module: str) -> float:
+    code = f'import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)'
+    output = subprocess.check_output([sys.executable, '-c', code], cwd=ROOT, env={**os.environ, 'PYTHONPATH': ROOT})
+    return float(output) * 1000
+
+def slowest(module: str, top: int) -> list[tuple[int, str]]:
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=ROOT, env={**os.environ, 'PYTHONPATH': ROOT}, capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line.split(':', 1)[1].split('|')
+        rows.append((int(self_us), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', type=int, default=20, help='重复次数')
+    parser.add_argument('--max', type=float, default=0, help='允许的最大中位数(毫秒)')
+    parser.add_argument('--module', default='muzi')
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    samples = [measure(args.module) for _ in range(args.n)]
+    median = statistics.median(samples)
+    print(f'import {args.module}: median {median:.1f}ms, min {min(samples):.1f}ms, max {max(samples):.1f}ms ({args.n} runs)')
+    print('slowest modules (self time):')
+    for us, name in slowest(args.module, args.top):
+        print(f'  {us/1000:8.1f}ms  {name}')
+    if args.max and median > args.max:
+        print(f'median {median:.1f}ms exceeds the limit {args.max:.1f}ms')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
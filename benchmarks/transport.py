@@ -0,0 +1,94 @@
+'''
+## websocket 传输层基准
+
+~~~
+python benchmarks/transport.py [-n 5000] [--transport fastapi asgi websockets]
+~~~
+
+* 每种传输层在独立的进程中启动 bot, 并使用`websockets`库作为 OneBot 端连接
+* `api`: bot 并发调用`n`次 API 并等待全部响应的耗时
+* `inbound`: OneBot 端连续发送`n`个心跳事件, bot 全部读取并解析的耗时
+'''
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+HEARTBEAT = json.dumps({
+    'time': 0, 'self_id': 1, 'post_type': 'meta_event', 'meta_event_type': 'heartbeat', 'interval': 5000,
+    'status': {'app_initialized': True, 'app_enabled': True, 'app_good': True, 'online': True, 'good': True},
+})
+
+
+async def bench(transport: str, n: int, port: int):
+    import websockets
+
+    import muzi
+
+    bot = muzi.init({'port': port, 'data_path': tempfile.mkdtemp(), 'extra_config': {'transport': transport}})
+    result = asyncio.get_running_loop().create_future()
+
+    @bot.on_connect
+    async def _():
+        start = time.perf_counter()
+        await asyncio.gather(*(bot.call_api('bench', i=i) for i in range(n)))
+        api = time.perf_counter() - start
+        start = time.perf_counter()
+        await bot.call_api('bench_inbound')
+        result.set_result((api, time.perf_counter() - start))
+
+    server = asyncio.create_task(bot.server.serve('127.0.0.1', port))
+    logging.disable(logging.INFO)
+    for _ in range(50):
+        try:
+            connection = await websockets.connect(f'ws://127.0.0.1:{port}{bot.config.ws_path}', additional_headers={'x-self-id': '1'})
+            break
+        except OSError:
+            await asyncio.sleep(0.1)
+    else:
+        raise RuntimeError('server did not start')
+
+    async def onebot():
+        async for frame in connection:
+            data = json.loads(frame)
+            if data['action'] == 'bench_inbound':
+                for _ in range(n):
+                    await connection.send(HEARTBEAT)
+            await connection.send(json.dumps({'status': 'ok', 'retcode': 0, 'data': None, 'echo': data['echo']}))
+
+    client = asyncio.create_task(onebot())
+    api, inbound = await result
+    print(json.dumps({'transport': transport, 'n': n, 'api': api, 'inbound': inbound}))
+    client.cancel()
+    server.cancel()
+    os._exit(0)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', type=int, default=5000)
+    parser.add_argument('--transport', nargs='+', default=['fastapi', 'asgi', 'websockets'])
+    parser.add_argument('--port', type=int, default=18765)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(bench(args.transport[0], args.n, args.port))
+        return
+
+    print(f'{"transport":<12}{"api calls/s":>14}{"inbound frames/s":>20}')
+    for i, transport in enumerate(args.transport):
+        output = subprocess.check_output([sys.executable, __file__, '--child', '-n', str(args.n), '--transport', transport, '--port', str(args.port + i)], cwd=ROOT)
+        data = json.loads(output.decode().strip().splitlines()[-1])
+        print(f'{transport:<12}{data["n"]/data["api"]:>14.0f}{data["n"]/data["inbound"]:>20.0f}')
+
+
+if __name__ == '__main__':
+    main()
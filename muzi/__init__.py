@@ -1,14 +1,45 @@
 import json
 
 from .bot import Bot, BotConfig
-from .message import CQcode, Message
+from .message import CQcode, Message, image_encoder
 from .plugin import Condition, Trigger
 from .plugin import current_bot as _current_bot
-from .plugin import load_plugin, load_plugin_dir, on_event, on_regex
+from .plugin import load_plugin, load_plugin_dir, on_command, on_event, on_keyword, on_regex
 
 DEFAULT_EXTRA_CONFIG = {
     'allow_load_plugin_without_trigger': False,
     'hide_plugin_without_trigger': True,
+    'lazy_plugin_preload': False,
+    'plugin_auto_reload': False,
+    'plugin_auto_reload_interval': 1.0,
+    'event_dedup_size': 4096,
+    'event_dedup_window': 120.0,
+    'command_prefixes': ['/'],
+    'history_size': 100,
+    'history_max_age': 86400.0,
+    'history_max_chats': 10000,
+    'history_prune_interval': 600.0,
+    'image_format': 'PNG',
+    'image_quality': 90,
+    'image_compress_level': 6,
+    'image_max_size': 0,
+    'transport': 'fastapi',
+    'event_loop': 'auto',
+    'ws_max_size': 16777216,
+    'ws_compression': True,
+    'admission': False,
+    'admission_max_inflight': 64,
+    'admission_max_pending': 2000,
+    'admission_budgets': dict(),
+    'trace_sample_rate': 0.0,
+    'trace_max_bytes': 10485760,
+    'trace_backups': 3,
+    'memory_monitor': False,
+    'memory_monitor_interval': 600.0,
+    'outbox_size': 1000,
+    'reconnect_timeout': 60.0,
+    'snapshot': True,
+    'snapshot_max_age': 3600.0,
 }
 
 DEFAULT_CONFIG = {
@@ -40,9 +71,15 @@ def init(config: dict|str = dict()):
     _extra_config.update(config_.pop('extra_config', {}))
     _config.update(config_)
     _config['extra_config'] = _extra_config
+    image_encoder.format = _extra_config['image_format']
+    image_encoder.quality = _extra_config['image_quality']
+    image_encoder.compress_level = _extra_config['image_compress_level']
+    image_encoder.max_size = _extra_config['image_max_size']
     botconfig = BotConfig(**_config)
     bot = Bot(botconfig)
     _current_bot.set(bot)
+    if _extra_config['memory_monitor']:
+        load_plugin('muzi.plugins.memory')
 
     return bot
 
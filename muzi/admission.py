@@ -0,0 +1,140 @@
+import asyncio
+import time
+from collections import deque
+from contextvars import Context, copy_context
+from typing import Any, Callable, Coroutine, Iterable
+
+from .event import Event, MessageEvent
+from .log import logger
+from .trace import Span, current_span
+
+CLASSES = ('superuser', 'to_me', 'message', 'notice')
+
+DEFAULT_BUDGETS = {
+    'superuser': (0, 0),
+    'to_me': (1000, 30.0),
+    'message': (1000, 10.0),
+    'notice': (500, 10.0),
+}
+
+class Admission:
+    '''
+    事件准入控制
+    * 事件按优先级从高到低分为`superuser`, `to_me`, `message`, `notice`四类, 每类使用独立的队列
+    * 同时处理的事件不超过`max_inflight`个, 有空位时总是先取出高优先级队列中的事件; 事件交出后不等待处理完成
+    * `budgets`为每类设置`(最大队列长度, 最长等待秒数)`, `0`表示不限制; 队列已满时丢弃该队列中最早的事件
+    * 所有队列的总长度不超过`max_pending`, 超过时丢弃更低优先级队列中最早的事件, 没有可丢弃的事件时丢弃新事件
+    * 等待超时的事件在出队时丢弃
+    * 事件在提交时的上下文(如当前 trace)会被保留到处理时
+    '''
+
+    __slots__ = ('handler', 'superusers', 'max_inflight', 'max_pending', 'budgets', 'stats', '_queues', '_inflight', '_running', '_reported')
+
+    def __init__(self, handler: Callable[[Event], Coroutine[Any, Any, Any]], superusers: Iterable[int] = (), max_inflight: int = 64, max_pending: int = 2000, budgets: dict|None = None):
+        self.handler = handler
+        self.superusers = set(superusers)
+        self.max_inflight = max_inflight
+        self.max_pending = max_pending
+        self.budgets = [tuple(DEFAULT_BUDGETS[name]) for name in CLASSES]
+        for name, budget in (budgets or {}).items():
+            if name not in CLASSES:
+                raise ValueError(f'admission class must be one of {CLASSES}, got {name!r}')
+            self.budgets[CLASSES.index(name)] = tuple(budget)
+        self.stats = {name: {'admitted': 0, 'shed': 0, 'expired': 0} for name in CLASSES}
+        self._queues: list[deque[tuple[float, Event, Context]]] = [deque() for _ in CLASSES]
+        self._inflight = 0
+        self._running = False
+        self._reported = 0.0
+
+    @property
+    def inflight(self) -> int:
+        '''正在处理的事件数'''
+        return self._inflight
+
+    @property
+    def pending(self) -> dict[str, int]:
+        '''各类队列中等待的事件数'''
+        return {name: len(queue) for name, queue in zip(CLASSES, self._queues)}
+
+    def classify(self, event: Event) -> int:
+        if isinstance(event, MessageEvent):
+            if event.user_id in self.superusers:
+                return 0
+            if event.to_me:
+                return 1
+            return 2
+        return 3
+
+    def submit(self, event: Event) -> bool:
+        '''
+        将事件加入队列
+        * 返回`False`表示事件被丢弃
+        '''
+        level = self.classify(event)
+        max_queue = self.budgets[level][0]
+        queue = self._queues[level]
+        if max_queue > 0 and len(queue) >= max_queue:
+            self._shed(level, span=queue.popleft()[2].get(current_span))
+        elif self.max_pending > 0 and sum(map(len, self._queues)) >= self.max_pending and not self._shed_lower(level):
+            self._shed(level, span=current_span.get())
+            return False
+        queue.append((time.monotonic(), event, copy_context()))
+        self.stats[CLASSES[level]]['admitted'] += 1
+        self._dispatch()
+        return True
+
+    async def start(self):
+        self._running = True
+        self._dispatch()
+
+    async def close(self):
+        self._running = False
+
+    def _shed_lower(self, level: int) -> bool:
+        for lower in range(len(CLASSES)-1, level, -1):
+            if self._queues[lower]:
+                self._shed(lower, span=self._queues[lower].popleft()[2].get(current_span))
+                return True
+        return False
+
+    def _shed(self, level: int, key: str = 'shed', span: Span|None = None):
+        self.stats[CLASSES[level]][key] += 1
+        if span is not None and span.parent is None:
+            span.finish(admission=key)
+        now = time.monotonic()
+        if now - self._reported >= 5:
+            self._reported = now
+            shed = ', '.join(f'{name}: {stats["shed"]}/{stats["expired"]}' for name, stats in self.stats.items())
+            logger.warning(f'<y>Admission</y> <r>is shedding events</r> (shed/expired) <c>{shed}</c>')
+
+    def _next(self) -> tuple[Event, Context]|None:
+        now = time.monotonic()
+        for level, queue in enumerate(self._queues):
+            max_wait = self.budgets[level][1]
+            while queue:
+                enqueued, event, context = queue.popleft()
+                if max_wait > 0 and now - enqueued > max_wait:
+                    self._shed(level, 'expired', context.get(current_span))
+                    continue
+                return event, context
+        return None
+
+    def _dispatch(self):
+        while self._running and self._inflight < self.max_inflight and (item := self._next()) is not None:
+            event, context = item
+            self._inflight += 1
+            context.run(asyncio.create_task, self._handle(event))
+
+    async def _handle(self, event: Event):
+        try:
+            await self.handler(event)
+        except Exception as e:
+            logger.error(f'<y>Admission</y> <r>failed to handle an event.</r>\n<r>{e}</r>')
+        finally:
+            self._inflight -= 1
+            self._dispatch()
+
+
+__all__ = [
+    'Admission',
+]
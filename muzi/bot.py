@@ -3,23 +3,36 @@ import atexit
 import json
 import sys
 import time
+from collections import deque
 from datetime import datetime
 from functools import partial
-from itertools import chain
+from itertools import chain, count
 from pathlib import Path
-from typing import Any, Callable, Coroutine
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Any, Callable, Coroutine, Iterable
 
-import uvicorn
-from fastapi import FastAPI, WebSocket
 from pydantic import BaseSettings, Extra
 
-from .event import Event, HeartbeatMetaEvent, MetaEvent, get_event, log_event
+from .admission import Admission
+from .broadcast import Broadcast, BroadcastResult
+from .event import (Deduplicator, Event, FriendRecallNoticeEvent,
+                    GroupRecallNoticeEvent, HeartbeatMetaEvent, MessageEvent,
+                    MetaEvent, _get_event_model, get_event, log_event)
 from .exception import ActionFailed, ConnectionFailed, ExecuteDone
+from .history import History
 from .log import logger
-from .message import JSONEncoder
-from .plugin import Executor, Plugin
-from .utils import get_exception_local
-
+from .memory import MemoryMonitor
+from .message import CQcode, JSONEncoder, Message
+from .plugin import Executor, Plugin, PluginSwitch, SessionIndex, watch_plugins
+from .scheduler import Scheduler
+from .snapshot import Snapshot
+from .storage import Storage
+from .trace import FileExporter, current_span, tracer
+from .transport import ASGIApp, StarletteTransport, Transport, WebsocketsTransport
+from .utils import add_disposer, get_exception_local
+
+if TYPE_CHECKING:
+    from fastapi import FastAPI
 
 ApiCall = partial[Coroutine[Any, Any, Any]]
 
@@ -49,9 +62,18 @@ class Bot:
     bootdate: datetime
     plugins: list[Plugin] = list()
     config: BotConfig
+    storage: Storage
+    scheduler: Scheduler
+    sessions: SessionIndex
+    plugin_switch: PluginSwitch
+    history: History
+    snapshot: Snapshot
+    admission: Admission|None = None
+    memory: MemoryMonitor|None = None
 
     _connected: bool = False
     _reboot: bool = False
+    _subscriptions: dict[type, bool]|None = None
 
     def __init__(self, config: BotConfig) -> None:
         self.config = config
@@ -59,43 +81,128 @@ class Bot:
         self.server = Server(self)
         self.server.set_websocket(config.ws_path)
         Path(self.config.data_path).mkdir(exist_ok=True, parents=True)
+
+        self.storage = Storage(str(Path(self.config.data_path) / 'storage.db'))
+
+        self.sessions = SessionIndex()
+
+        self.plugin_switch = PluginSwitch(self.storage.namespace('muzi.plugin_switch'))
+        self.on_startup(self.plugin_switch.load)
+
+        self.snapshot = Snapshot(str(Path(self.config.data_path) / 'snapshot.bin'), self.config.extra_config['snapshot_max_age'], self.config.extra_config['snapshot'])
+        self.server._on_close.append(self.snapshot.close)
+        self.server._on_close.append(self.storage.close)
+
+        self.history = History(self.config.extra_config['history_size'], self.config.extra_config['history_max_age'], max_chats=self.config.extra_config['history_max_chats'])
+        self.snapshot.register('muzi.history', self.history.dump, self.history.load)
+        self.snapshot.register('muzi.dedup', self.server.deduplicator.cache.dump, self.server.deduplicator.cache.load)
+
+        self.scheduler = Scheduler(self.storage.namespace('muzi.scheduler'))
+        self.scheduler.handler('muzi.recall')(self._recall)
+        self.on_startup(self.scheduler.start)
+        self.on_connect(self.scheduler.restore, temp=True)
+        if self.history.size > 0:
+            self.scheduler.call_every(self.config.extra_config['history_prune_interval'], self.history.prune)
+
+        if self.config.extra_config['admission']:
+            self.admission = Admission(self.handle_event, self.config.superusers, self.config.extra_config['admission_max_inflight'], self.config.extra_config['admission_max_pending'], self.config.extra_config['admission_budgets'])
+            self.on_startup(self.admission.start)
+            self.on_shutdown(self.admission.close)
+
+        if (sample_rate := self.config.extra_config['trace_sample_rate']) > 0:
+            tracer.sample_rate = sample_rate
+            if tracer.exporter is None:
+                tracer.exporter = FileExporter(str(Path(self.config.data_path) / 'trace.jsonl'), self.config.extra_config['trace_max_bytes'], self.config.extra_config['trace_backups'])
+            self.on_shutdown(tracer.flush)
+
+        if self.config.extra_config['memory_monitor']:
+            self.memory = MemoryMonitor(self, self.config.extra_config['memory_monitor_interval'])
+            self.on_startup(self.memory.start)
+            self.on_shutdown(self.memory.close)
+            if self.config.extra_config['transport'] != 'websockets':
+                memory = self.memory
+                async def memory_report():
+                    return await memory.report()
+                self.server.app.add_api_route('/muzi/memory', memory_report, methods=['GET'])
+
+        if self.config.extra_config['plugin_auto_reload']:
+            interval = self.config.extra_config['plugin_auto_reload_interval']
+            async def start_watcher():
+                asyncio.create_task(watch_plugins(self, interval))
+            self.on_startup(start_watcher)
     
+    def refresh_subscriptions(self):
+        '''触发器变化后调用, 重新计算需要解析的事件类型'''
+        self._subscriptions = None
+
+    def is_subscribed(self, model: type) -> bool:
+        '''是否有触发器或内部功能需要该类型的事件'''
+        if self._subscriptions is None:
+            self._subscriptions = dict()
+        if (subscribed := self._subscriptions.get(model)) is None:
+            subscribed = self._subscriptions[model] = any(issubclass(model, event) for event in self._subscribed_events())
+        return subscribed or len(self.sessions) > 0
+
+    def _subscribed_events(self) -> set[type]:
+        events: set[type] = {MetaEvent}
+        if self.history.size > 0:
+            events.update((MessageEvent, GroupRecallNoticeEvent, FriendRecallNoticeEvent))
+        for plugin in self.plugins:
+            if plugin.lazy:
+                events.update(plugin.manifest.events if plugin.manifest else (Event,))
+            events.update(trigger.event for trigger in plugin.triggers)
+        return events
+
     def __getattr__(self, name: str) -> ApiCall:
         return partial(self.call_api, name)
 
     async def call_api(self, api: str, **data):
         return await self.server.call_api(api, **data)
 
+    async def broadcast(self, message: Message|str|CQcode, group_ids: Iterable[int] = (), user_ids: Iterable[int] = (), concurrency: int = 4, interval: float = 0.2, id: str|None = None) -> BroadcastResult:
+        return await Broadcast.new(self, message, group_ids, user_ids, concurrency, interval, id).run()
+
+    async def resume_broadcast(self, id: str) -> BroadcastResult|None:
+        if broadcast := await Broadcast.load(self, id):
+            return await broadcast.run()
+        return None
+
+    async def _recall(self, message_id: int):
+        try:
+            await self.delete_msg(message_id=message_id)
+        except:
+            pass
+
     def on_startup(self, func: Callable):
-        self.server._server_app.on_event('startup')(func)
+        self.server._on_startup.append(func)
+        add_disposer(partial(_discard, self.server._on_startup, func))
         return func
     
     def on_shutdown(self, func: Callable):
-        self.server._server_app.on_event('shutdown')(func)
+        self.server._on_shutdown.append(func)
+        add_disposer(partial(_discard, self.server._on_shutdown, func))
         return func
     
     def on_connect(self, func: Callable|None = None, temp: bool = False):
         def wrap(func):
             excutor = Executor.new(func)
-            if temp:
-                self.server._on_bot_connect_temp.append(excutor)
-            else:
-                self.server._on_bot_connect.append(excutor)
+            hooks = self.server._on_bot_connect_temp if temp else self.server._on_bot_connect
+            hooks.append(excutor)
+            add_disposer(partial(_discard, hooks, excutor))
             return func
         return wrap(func) if func is not None else wrap
 
     def on_disconnect(self, func: Callable|None = None, temp: bool = False):
         def wrap(func):
             excutor = Executor.new(func)
-            if temp:
-                self.server._on_bot_disconnect_temp.append(excutor)
-            else:
-                self.server._on_bot_disconnect.append(excutor)
+            hooks = self.server._on_bot_disconnect_temp if temp else self.server._on_bot_disconnect
+            hooks.append(excutor)
+            add_disposer(partial(_discard, hooks, excutor))
             return func
         return wrap(func) if func is not None else wrap
 
     def run(self):
-        uvicorn.run(self.server.asgi, host=self.config.host, port=self.config.port)
+        self.server.run(self.config.host, self.config.port)
 
     def reboot(self):
         self._connected = False
@@ -103,6 +210,13 @@ class Bot:
         logger.warning(f'<y>Bot</y> [<c>{self.qid}</c>] <y>is rebooting.</y>')
 
     async def handle_event(self, event: Event):
+        if (span := current_span.get()) is not None and span.parent is None:
+            with span:
+                await self._handle_event(event)
+        else:
+            await self._handle_event(event)
+
+    async def _handle_event(self, event: Event):
         if isinstance(event, MetaEvent):
             if isinstance(event, HeartbeatMetaEvent):
                 if not event.status.online:
@@ -110,18 +224,43 @@ class Bot:
                     return
         else:
             log_event(event)
+            if isinstance(event, MessageEvent):
+                self.history.add(event)
+            elif isinstance(event, (GroupRecallNoticeEvent, FriendRecallNoticeEvent)):
+                self.history.recall(event.message_id)
+            if self.sessions.feed(event):
+                return
+            mask = self.plugin_switch.mask(event)
             for plugin in self.plugins:
                 if not plugin.enable:
                     continue
+                if mask and self.plugin_switch.blocked(mask, plugin.module_path):
+                    continue
+                if plugin.lazy:
+                    if plugin.manifest is None or not plugin.manifest.match(event):
+                        continue
+                    await plugin.load()
                 for trigger in plugin.triggers:
                     if not await trigger._check(event):
                         continue
                     logger.info(f'<y>Trigger</y> [<m>{plugin.module_path}</m>.<g>{trigger._instance_name}</g>] will handle this event.')
                     await logger.complete()
+                    limiter = trigger.limiter or plugin.limiter
                     try:
-                        await trigger.execute_functions()
+                        if limiter is None:
+                            await trigger.execute_functions()
+                        elif not await limiter.run(trigger.execute_functions):
+                            logger.warning(f'<y>Trigger</y> [<m>{plugin.module_path}</m>.<g>{trigger._instance_name}</g>] <y>reaches its concurrency limit, the event is shed.</y>')
+                            if trigger.block:
+                                break
+                            continue
                     except ExecuteDone:
                         pass
+                    except asyncio.TimeoutError:
+                        logger.warning(f'<y>Trigger</y> [<m>{plugin.module_path}</m>.<g>{trigger._instance_name}</g>] <r>execution timed out.</r>')
+                        if trigger.block:
+                            break
+                        continue
                     except Exception as e:
                         local = '\n'.join(get_exception_local(e))
                         logger.info(f'<y>Trigger</y> [<m>{plugin.module_path}</m>.<g>{trigger._instance_name}</g>] <r>catch an exception.</r>\n{local}\n<r>{e}</r>')
@@ -138,7 +277,7 @@ class Bot:
 
 class Server:
     bot: Bot
-    websocket: WebSocket
+    transport: Transport|None
 
     _on_bot_connect: list[Executor] = []
     _on_bot_disconnect: list[Executor] = []
@@ -150,69 +289,272 @@ class Server:
 
     def __init__(self, bot) -> None:
         self.bot = bot
-        self._server_app = FastAPI()
-        
+        self._app: 'FastAPI|None' = None
+        self._ws_path: str = '/'
+        self._on_startup: list[Callable] = []
+        self._on_shutdown: list[Callable] = []
+        self._on_close: list[Callable] = []
+        self._echo = count()
+        self.unsubscribed = 0
+        self.transport = None
+        extra_config = bot.config.extra_config
+        self.deduplicator = Deduplicator(extra_config['event_dedup_size'], extra_config['event_dedup_window'])
+        self._outbox: deque[tuple[str, asyncio.Future]] = deque()
+        self._outbox_size: int = extra_config['outbox_size']
+        self._reconnect_timeout: float = extra_config['reconnect_timeout']
+
+    @property
+    def app(self) -> 'FastAPI':
+        '''FastAPI 应用, 可以在其上添加 HTTP 路由'''
+        return self._server_app
+
+    @property
+    def _server_app(self) -> 'FastAPI':
+        if self._app is None:
+            from fastapi import FastAPI, WebSocket
+            self._app = FastAPI(lifespan=self._lifespan)
+            async def handle_ws(websocket: WebSocket):
+                await self._handle_ws(StarletteTransport(websocket))
+            self._app.add_api_websocket_route(self._ws_path, handle_ws)
+        return self._app
+
+    @asynccontextmanager
+    async def _lifespan(self, app):
+        await self._startup()
+        await app.router.startup()
+        yield
+        await app.router.shutdown()
+        await self._shutdown()
+
+    async def _startup(self):
+        for func in self._on_startup:
+            if asyncio.iscoroutine(result := func()):
+                await result
+
+    async def _shutdown(self):
+        for func in self._on_shutdown:
+            if asyncio.iscoroutine(result := func()):
+                await result
+        for func in self._on_close:
+            if asyncio.iscoroutine(result := func()):
+                await result
+
     def set_websocket(self, path):
-        async def handle_ws(websocket: WebSocket):
-            await websocket.accept()
+        self._ws_path = path
 
-            self.websocket = websocket
-            if qid := websocket.headers.get('x-self-id', None):
-                self.bot.qid = int(qid)
-                self.bot._connected = True
-            else:
-                raise ConnectionFailed
-            
-            self.bot.bootdate = datetime.now()
+    @property
+    def _transport_options(self) -> dict:
+        extra_config = self.bot.config.extra_config
+        return {
+            'transport': extra_config['transport'],
+            'event_loop': extra_config['event_loop'],
+            'ws_max_size': extra_config['ws_max_size'],
+            'ws_compression': extra_config['ws_compression'],
+        }
+
+    def run(self, host: str, port: int):
+        '''
+        启动服务
+        * `extra_config.transport`: `fastapi` 使用 FastAPI 路由, `asgi` 使用精简的 ASGI 应用, `websockets` 使用`websockets`库且不提供 HTTP 路由
+        * `extra_config.event_loop`: `auto`, `asyncio` 或 `uvloop`
+        * `extra_config.ws_max_size`: 最大帧大小(字节)
+        * `extra_config.ws_compression`: 是否启用 permessage-deflate 压缩
+        '''
+        options = self._transport_options
+        if options['transport'] == 'websockets':
+            if options['event_loop'] == 'uvloop':
+                import uvloop
+                asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+            try:
+                asyncio.run(self.serve(host, port))
+            except KeyboardInterrupt:
+                pass
+        else:
+            import uvicorn
+            uvicorn.run(self.asgi, host=host, port=port, loop=options['event_loop'], ws_max_size=options['ws_max_size'], ws_per_message_deflate=options['ws_compression'])
+
+    async def serve(self, host: str, port: int):
+        '''在当前事件循环中启动服务'''
+        options = self._transport_options
+        if options['transport'] == 'websockets':
+            from urllib.parse import urlsplit
+            from websockets.asyncio.server import serve
+            async def handler(connection):
+                if urlsplit(connection.request.path).path != self._ws_path:
+                    await connection.close(1008)
+                    return
+                await self._handle_ws(WebsocketsTransport(connection))
+            await self._startup()
+            try:
+                async with serve(handler, host, port, max_size=options['ws_max_size'], compression='deflate' if options['ws_compression'] else None):
+                    await asyncio.get_running_loop().create_future()
+            finally:
+                await self._shutdown()
+        else:
+            import uvicorn
+            config = uvicorn.Config(self.asgi, host=host, port=port, loop=options['event_loop'], ws_max_size=options['ws_max_size'], ws_per_message_deflate=options['ws_compression'])
+            await uvicorn.Server(config).serve()
+
+    async def _handle_ws(self, transport: Transport):
+        await transport.accept()
+
+        if qid := transport.headers.get('x-self-id', None):
+            if self._outbox and getattr(self.bot, 'qid', None) != int(qid):
+                self._drop_outbox()
+            self.transport = transport
+            self.bot.qid = int(qid)
+            self.bot._connected = True
+        else:
+            raise ConnectionFailed
+        
+        self.bot.bootdate = datetime.now()
 
-            asyncio.create_task(self.on_bot_connect())
+        asyncio.create_task(self.on_bot_connect())
+        if self._outbox:
+            asyncio.create_task(self._flush_outbox(transport))
 
+        try:
+            while self.bot._connected:
+                self._handle_frame(await transport.receive())
+        except:
+            pass
+        if self.transport is not transport:
+            return
+        self.transport = None
+        self.bot._connected = False
+        if self.bot.config.auto_reconnect and not self.bot._reboot:
+            logger.warning(f'<y>Bot</y> [<c>{self.bot.qid}</c>] <y>is disconnected, API calls are buffered until it reconnects.</y>')
+            asyncio.create_task(self.on_bot_disconnect())
             try:
-                while self.bot._connected:
-                    data = await websocket.receive_json()
-                    if 'post_type' in data:
-                        if event := get_event(data):
-                            asyncio.create_task(self.bot.handle_event(event))
-                    else:
-                        self._store_api_result(data)
-                if self.bot._reboot:
-                    self.bot._reboot = False
-                    atexit.register(self.bot.run)
-                asyncio.create_task(self.on_bot_disconnect())
-                await self.websocket.close()
-                sys.exit()
+                await transport.close()
             except:
                 pass
+            return
+        try:
+            if self.bot._reboot:
+                self.bot._reboot = False
+                atexit.register(self.bot.run)
+            asyncio.create_task(self.on_bot_disconnect())
+            await transport.close()
+            sys.exit()
+        except:
+            pass
+
+    def _handle_frame(self, frame: str|bytes):
+        '''
+        解析一帧数据, 事件交给 bot 处理, API 响应交给等待的调用
+        * 只有交给 bot 处理的事件才会被采样, 解析的耗时在采样后补记
+        '''
+        traced = tracer.enabled
+        start = time.perf_counter() if traced else 0.0
+        data = json.loads(frame)
+        if 'post_type' not in data:
+            self._store_api_result(data)
+            return
+        model = _get_event_model(data)
+        if model is None:
+            return
+        if not self.bot.is_subscribed(model):
+            self.unsubscribed += 1
+            return
+        if self.deduplicator.is_duplicate(data):
+            return
+        parsed = time.perf_counter() if traced else 0.0
+        event = get_event(data, model)
+        if event is None:
+            return
+        if traced and (span := tracer.start_trace('event', start)) is not None:
+            span.record('parse', start, parsed)
+            span.record('get_event', parsed, time.perf_counter(), model=model.__name__)
+            token = current_span.set(span)
+            try:
+                self._dispatch(event)
+            finally:
+                current_span.reset(token)
+        else:
+            self._dispatch(event)
 
-        self._server_app.add_api_websocket_route(path, handle_ws)
+    def _dispatch(self, event: Event):
+        if self.bot.admission is None or isinstance(event, MetaEvent) or self.bot.sessions.waiting(event):
+            asyncio.create_task(self.bot.handle_event(event))
+        else:
+            self.bot.admission.submit(event)
 
     async def call_api(self, api, **data):
-        echo = str(time.time()) 
-        json_data = json.dumps({'action': api, 'params': data, 'echo': echo}, cls=JSONEncoder)
-        await self._send(json_data)
+        return await self.call_api_raw(api, json.dumps(data, cls=JSONEncoder))
+
+    async def call_api_raw(self, api: str, params: str):
+        '''使用已序列化为 JSON 的参数调用 API'''
+        echo = str(next(self._echo))
+        future = asyncio.get_running_loop().create_future()
+        self._api_result[echo] = future
         try:
-            return await self._fetch_api_result(echo)
+            with tracer.span('call_api', api=api):
+                await self._send(f'{{"action": {json.dumps(api)}, "params": {params}, "echo": "{echo}"}}')
+                return await self._fetch_api_result(future)
         except asyncio.TimeoutError:
             return None
+        finally:
+            del self._api_result[echo]
 
     def _store_api_result(self, data):
         echo = data.get('echo')
         if feture := self._api_result.get(echo, None):
-            feture.set_result(data)
+            if not feture.done():
+                feture.set_result(data)
 
-    async def _fetch_api_result(self, echo):
-        future = asyncio.get_event_loop().create_future()
-        self._api_result[echo] = future
-        try:
-            data = await asyncio.wait_for(future, timeout=self.bot.config.api_timeout)
-            if data['status'] == 'failed':
-                raise ActionFailed(data)
-            return data.get('data', dict())
-        finally:
-            del self._api_result[echo]
+    async def _fetch_api_result(self, future: asyncio.Future):
+        data = await asyncio.wait_for(future, timeout=self.bot.config.api_timeout)
+        if data['status'] == 'failed':
+            raise ActionFailed(data)
+        return data.get('data', dict())
 
     async def _send(self, data):
-        await self.websocket.send({'type': 'websocket.send', 'text': data})
+        if (transport := self.transport) is not None and not self._outbox:
+            try:
+                return await transport.send(data)
+            except Exception:
+                if not self.bot.config.auto_reconnect:
+                    raise
+        elif not self.bot.config.auto_reconnect:
+            raise ConnectionFailed
+        await self._buffer(data)
+
+    async def _buffer(self, data: str):
+        '''连接断开时缓存待发送的数据, 在同一账号重新连接后按顺序发送'''
+        if len(self._outbox) >= self._outbox_size:
+            _, dropped = self._outbox.popleft()
+            if not dropped.done():
+                dropped.set_exception(ConnectionFailed('outbox is full'))
+        future = asyncio.get_running_loop().create_future()
+        item = (data, future)
+        self._outbox.append(item)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self._reconnect_timeout)
+        except asyncio.TimeoutError:
+            if item in self._outbox:
+                self._outbox.remove(item)
+            raise
+
+    async def _flush_outbox(self, transport: Transport):
+        count = len(self._outbox)
+        while self._outbox and self.transport is transport:
+            data, future = self._outbox[0]
+            if not future.done():
+                try:
+                    await transport.send(data)
+                except Exception:
+                    return
+                future.set_result(None)
+            if self._outbox and self._outbox[0][1] is future:
+                self._outbox.popleft()
+        logger.info(f'<y>Bot</y> [<c>{self.bot.qid}</c>] resumed, <c>{count}</c> buffered frames were sent.')
+
+    def _drop_outbox(self):
+        while self._outbox:
+            _, future = self._outbox.popleft()
+            if not future.done():
+                future.set_exception(ConnectionFailed('connected with a different account'))
 
     async def on_bot_connect(self):
         for exc in chain(self._on_bot_connect, self._on_bot_connect_temp):
@@ -239,7 +581,14 @@ class Server:
 
     @property
     def asgi(self):
+        if self._transport_options['transport'] == 'asgi':
+            return ASGIApp(self._ws_path, self._handle_ws, lambda: self._server_app)
         return self._server_app
+
+
+def _discard(items: list, item: Any):
+    if item in items:
+        items.remove(item)
     
 __all__ = [
     'Bot',
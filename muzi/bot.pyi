@@ -1,14 +1,22 @@
 import asyncio
 from datetime import datetime
 from functools import partial
-from typing import Any, Callable, Coroutine, Dict, List
+from typing import Any, Callable, Coroutine, Dict, Iterable, List
 
-from fastapi import FastAPI, WebSocket
+from fastapi import FastAPI
 from pydantic import BaseSettings
 
+from .admission import Admission
+from .broadcast import BroadcastResult
 from .event import Event
+from .history import History
+from .memory import MemoryMonitor
 from .message import Message
-from .plugin import Executor, Plugin
+from .plugin import Executor, Plugin, PluginSwitch, SessionIndex
+from .scheduler import Scheduler
+from .snapshot import Snapshot
+from .storage import Storage
+from .transport import Transport
 
 ApiCall = partial[Coroutine[Any, Any, Any]]
 
@@ -31,6 +39,14 @@ class Bot:
     bootdate: datetime
     plugins: List[Plugin]
     config: BotConfig
+    storage: Storage
+    scheduler: Scheduler
+    sessions: SessionIndex
+    plugin_switch: PluginSwitch
+    history: History
+    snapshot: Snapshot
+    admission: Admission|None
+    memory: MemoryMonitor|None
 
     def __init__(self, config: BotConfig):...
     def __getattr__(self, name: str) -> ApiCall:...
@@ -38,6 +54,19 @@ class Bot:
     def run(self):...
     def reboot(self):...
     async def handle_event(self, event: Event):...
+    def refresh_subscriptions(self):...
+    def is_subscribed(self, model: type) -> bool:...
+
+    async def broadcast(self, message: Message|str, group_ids: Iterable[int] = ..., user_ids: Iterable[int] = ..., concurrency: int = 4, interval: float = 0.2, id: str|None = None) -> BroadcastResult:
+        '''
+        ## 批量发送消息
+        * 消息只序列化一次, 同时最多有`concurrency`个发送, 每个发送完成后等待`interval`秒
+        * 返回每个目标的发送结果
+        '''
+    async def resume_broadcast(self, id: str) -> BroadcastResult|None:
+        '''
+        ## 继续被中断的批量发送
+        '''
 
     def on_startup(self, func: Callable) -> Callable:
         '''
@@ -684,7 +713,7 @@ class Bot:
         
 class Server:
     bot: Bot
-    websocket: WebSocket
+    transport: Transport|None
 
     _on_bot_connect: List[Executor]
     _on_bot_disconnect: List[Executor]
@@ -693,12 +722,17 @@ class Server:
 
     def __init__(self, bot):...
     def set_websocket(self, path):...
+    def run(self, host: str, port: int):...
+    async def serve(self, host: str, port: int):...
     async def call_api(self, api, **data):...
+    async def call_api_raw(self, api: str, params: str):...
     def _store_api_result(self, data):...
-    async def _fetch_api_result(self, echo):...
+    async def _fetch_api_result(self, future: asyncio.Future):...
     async def _send(self, data):...
     async def on_bot_connect(self):...
     async def on_bot_disconnect(self):...
 
     @property
-    def asgi(self) -> FastAPI:...
\ No newline at end of file
+    def app(self) -> FastAPI:...
+    @property
+    def asgi(self) -> Any:...
\ No newline at end of file
@@ -0,0 +1,97 @@
+import asyncio
+import json
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Iterable
+from uuid import uuid4
+
+from .exception import ActionFailed
+from .log import logger
+from .message import CQcode, JSONEncoder, Message
+
+if TYPE_CHECKING:
+    from .bot import Bot
+
+Target = tuple[str, int]
+
+_API = {'group': ('send_group_msg', 'group_id'), 'private': ('send_private_msg', 'user_id')}
+
+
+@dataclass(eq=False)
+class BroadcastResult:
+    id: str
+    succeeded: list[Target] = field(default_factory=list)
+    failed: dict[Target, str] = field(default_factory=dict)
+
+
+class Broadcast:
+    '''
+    批量发送
+    * 消息只序列化一次, 每个目标只拼接参数
+    * 同时最多有`concurrency`个发送, 每个发送完成后等待`interval`秒
+    * 每个发送完成后都会记录进度(存储会合并短时间内的写入), 被取消或出错时也会保存进度, 中断后可以通过`Bot.resume_broadcast`继续
+    '''
+
+    def __init__(self, bot: 'Bot', id: str, message: str, targets: list[Target], concurrency: int = 4, interval: float = 0.2):
+        self.bot = bot
+        self.id = id
+        self.message = message
+        self.targets = targets
+        self.concurrency = concurrency
+        self.interval = interval
+        self.result = BroadcastResult(id)
+        self._storage = bot.storage.namespace('muzi.broadcast')
+
+    @classmethod
+    def new(cls, bot: 'Bot', message: Message|str|CQcode, group_ids: Iterable[int] = (), user_ids: Iterable[int] = (), concurrency: int = 4, interval: float = 0.2, id: str|None = None):
+        targets = [('group', i) for i in group_ids] + [('private', i) for i in user_ids]
+        return cls(bot, id or uuid4().hex, json.dumps(Message(message).message, cls=JSONEncoder), targets, concurrency, interval)
+
+    @classmethod
+    async def load(cls, bot: 'Bot', id: str):
+        '''从存储中读取未完成的批量发送'''
+        if (data := await bot.storage.namespace('muzi.broadcast').get(id)) is None:
+            return None
+        done = {tuple(t) for t in data['done']}
+        targets = [tuple(t) for t in data['targets'] if tuple(t) not in done]
+        return cls(bot, id, data['message'], targets, data['concurrency'], data['interval']) # type: ignore
+
+    async def run(self) -> BroadcastResult:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        await self._storage.set(self.id, self._dump())
+        async def send(target: Target):
+            async with semaphore:
+                await self._send(target)
+                self._storage.set_nowait(self.id, self._dump())
+                await asyncio.sleep(self.interval)
+        try:
+            await asyncio.gather(*(send(t) for t in self.targets))
+        except BaseException:
+            self._storage.set_nowait(self.id, self._dump())
+            raise
+        await self._storage.delete(self.id)
+        logger.info(f'<y>Broadcast</y> [<c>{self.id}</c>] finished, <g>{len(self.result.succeeded)}</g> succeeded, <r>{len(self.result.failed)}</r> failed.')
+        return self.result
+
+    async def _send(self, target: Target):
+        api, key = _API[target[0]]
+        try:
+            response = await self.bot.server.call_api_raw(api, f'{{"{key}": {int(target[1])}, "message": {self.message}}}')
+        except ActionFailed as e:
+            self.result.failed[target] = str(e)
+        except Exception as e:
+            self.result.failed[target] = repr(e)
+        else:
+            if response is None:
+                self.result.failed[target] = 'timeout'
+            else:
+                self.result.succeeded.append(target)
+
+    def _dump(self) -> dict:
+        done = self.result.succeeded + list(self.result.failed)
+        return {'message': self.message, 'targets': self.targets, 'done': done, 'concurrency': self.concurrency, 'interval': self.interval}
+
+
+__all__ = [
+    'Broadcast',
+    'BroadcastResult',
+]
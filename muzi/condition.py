@@ -1,6 +1,10 @@
-from .plugin import Condition
+import time
+from typing import Callable, Hashable
+
+from .plugin import Condition, current_bot
 from .event import *
 from .bot import Bot
+from .utils import LRUCache
 
 async def _is_superuser(bot: Bot, event: MessageEvent):
     return event.user_id in bot.config.superusers
@@ -28,4 +32,62 @@ FRIEND = Condition(_is_friend)
 
 GROUP_OWNER = Condition(_is_group_owner)
 GROUP_ADMIN = Condition(_is_group_admin)
-GROUP_MEMBER = Condition(_is_group_member)
\ No newline at end of file
+GROUP_MEMBER = Condition(_is_group_member)
+
+
+_KEYS: dict[str, Callable[[Event], Hashable]] = {
+    'user': lambda e: getattr(e, 'user_id', None),
+    'group': lambda e: getattr(e, 'group_id', None) or ('user', getattr(e, 'user_id', None)),
+    'group_user': lambda e: (getattr(e, 'group_id', None), getattr(e, 'user_id', None)),
+    'global': lambda e: None,
+}
+
+def _persist(kind: str, name: str|None, store: LRUCache):
+    if name is not None and (bot := current_bot.get(None)) is not None:
+        bot.snapshot.register(f'muzi.{kind}.{name}', store.dump, store.load)
+
+def rate_limit(count: int, period: float, key: str = 'user', maxsize: int = 10000, name: str|None = None):
+    '''
+    ## 滑动窗口频率限制
+    * 每个`key`在任意`period`秒内最多通过`count`次
+    * `key`: `user`, `group`, `group_user`, `global`
+    * 计数器保存在容量为`maxsize`的 LRU 中, 内存占用有上限
+    * 设置了`name`时计数器会保存到快照中, 重启后恢复
+    '''
+    get_key = _KEYS[key]
+    store = LRUCache(maxsize, period * 2)
+    _persist('rate_limit', name, store)
+    def _rate_limit(event: Event):
+        k = get_key(event)
+        now = time.time()
+        window = int(now // period)
+        state = store.get(k)
+        if state is None or state[0] < window - 1:
+            current, previous = 0, 0
+        elif state[0] == window - 1:
+            current, previous = 0, state[1]
+        else:
+            current, previous = state[1], state[2]
+        if previous * (1 - now % period / period) + current >= count:
+            return False
+        store.set(k, (window, current + 1, previous))
+        return True
+    return Condition(stateful=(_rate_limit,))
+
+def cooldown(seconds: float, key: str = 'user', maxsize: int = 10000, name: str|None = None):
+    '''
+    ## 冷却时间
+    * 每个`key`在通过后的`seconds`秒内不会再次通过
+    * `key`: `user`, `group`, `group_user`, `global`
+    * 设置了`name`时冷却状态会保存到快照中, 重启后恢复
+    '''
+    get_key = _KEYS[key]
+    store = LRUCache(maxsize, seconds)
+    _persist('cooldown', name, store)
+    def _cooldown(event: Event):
+        k = get_key(event)
+        if k in store:
+            return False
+        store.set(k, time.time())
+        return True
+    return Condition(stateful=(_cooldown,))
@@ -1,9 +1,13 @@
-from typing import Optional, Type
+import hashlib
+import json
+from functools import cache
+from typing import Hashable, Optional, Type
 
 from pydantic import BaseModel, validator
 
 from .log import logger
 from .message import Message
+from .utils import LRUCache
 
 
 class Sender(BaseModel):
@@ -241,7 +245,14 @@ def _named_event(event: Type[Event]):
             break
     return name
 
-EVENT_TYPE = {_named_event(event): event for event in _get_all_subclass(Event)}
+@cache
+def _event_types() -> dict[str, Type[Event]]:
+    return {_named_event(event): event for event in _get_all_subclass(Event)}
+
+def __getattr__(name: str):
+    if name == 'EVENT_TYPE':
+        return _event_types()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 def _get_event_model(json_data: dict):
     name = ''
@@ -250,7 +261,7 @@ def _get_event_model(json_data: dict):
         if _type := json_data.get(post_type, ''):
             name = '.'.join([post_type, _type, sub_type])
             break
-    return EVENT_TYPE.get(name, Event) if name else None
+    return _event_types().get(name, Event) if name else None
 
 def _check_to_me(event: MessageEvent):
     if event.message_type == 'group':
@@ -258,8 +269,8 @@ def _check_to_me(event: MessageEvent):
     else:
         event.to_me = True
 
-def get_event(json_data: dict) -> Event | None:
-    if model := _get_event_model(json_data):
+def get_event(json_data: dict, model: Type[Event]|None = None) -> Event | None:
+    if model := model or _get_event_model(json_data):
         event = model.parse_obj(json_data)
         if isinstance(event, MessageEvent):
             _check_to_me(event)
@@ -267,6 +278,36 @@ def get_event(json_data: dict) -> Event | None:
     else:
         return None
 
+def _event_key(json_data: dict) -> Hashable|None:
+    post_type = json_data.get('post_type')
+    if post_type == 'meta_event':
+        return None
+    if post_type == 'message' and (message_id := json_data.get('message_id')) is not None:
+        return ('message', json_data.get('self_id'), message_id)
+    return hashlib.blake2b(json.dumps(json_data, sort_keys=True, ensure_ascii=False).encode(), digest_size=8).digest()
+
+class Deduplicator:
+    '''
+    重复事件过滤
+    * 消息事件以`message_id`为键, 其余事件以内容的摘要为键, 元事件不参与过滤
+    * 键保存在容量为`maxsize`, 存活`window`秒的 LRU 中
+    '''
+
+    __slots__ = ('cache', 'suppressed')
+
+    def __init__(self, maxsize: int = 4096, window: float = 120):
+        self.cache = LRUCache(maxsize, window)
+        self.suppressed = 0
+
+    def is_duplicate(self, json_data: dict) -> bool:
+        if (key := _event_key(json_data)) is None:
+            return False
+        if key in self.cache:
+            self.suppressed += 1
+            return True
+        self.cache.set(key, True)
+        return False
+
 def log_event(event: Event):
     if isinstance(event, MetaEvent):
         return
@@ -5,4 +5,6 @@ class ExecuteDone(Exception):...
 
 class ConnectionFailed(Exception):...
 
+class ConnectionClosed(Exception):...
+
 class ActionFailed(Exception):...
\ No newline at end of file
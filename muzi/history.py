@@ -0,0 +1,135 @@
+import time
+from collections import OrderedDict, deque
+from typing import Iterable
+
+from .event import GroupMessageEvent, MessageEvent
+from .utils import LRUCache
+
+
+class MessageRecord:
+    '''消息记录'''
+
+    __slots__ = ('message_id', 'time', 'self_id', 'group_id', 'user_id', 'raw_message', 'recalled')
+
+    def __init__(self, message_id: int, time: int, self_id: int, group_id: int|None, user_id: int, raw_message: str):
+        self.message_id = message_id
+        self.time = time
+        self.self_id = self_id
+        self.group_id = group_id
+        self.user_id = user_id
+        self.raw_message = raw_message
+        self.recalled = False
+
+    def __repr__(self) -> str:
+        return f'MessageRecord(message_id={self.message_id}, group_id={self.group_id}, user_id={self.user_id}, raw_message={self.raw_message!r})'
+
+
+class History:
+    '''
+    消息历史
+    * 每个群聊/私聊保留最近`size`条消息, 超过`max_age`秒的消息不会被返回
+    * 以`message_id`和用户建立索引, 查询无需调用 API
+    * 最多为`max_users`个最近发言的用户保留索引, 最多保留`max_chats`个最近有消息的群聊/私聊
+    * 过期的消息在同一会话有新消息或调用`prune`时清除
+    '''
+
+    __slots__ = ('size', 'max_age', 'max_chats', '_chats', '_users', '_index')
+
+    def __init__(self, size: int = 100, max_age: float = 86400, max_users: int = 10000, max_chats: int = 10000):
+        self.size = size
+        self.max_age = max_age
+        self.max_chats = max_chats
+        self._chats: OrderedDict[tuple[str, int], deque[MessageRecord]] = OrderedDict()
+        self._users = LRUCache(max_users)
+        self._index: dict[int, MessageRecord] = {}
+
+    def __len__(self):
+        return len(self._index)
+
+    def add(self, event: MessageEvent) -> MessageRecord|None:
+        if self.size <= 0:
+            return None
+        group_id = event.group_id if isinstance(event, GroupMessageEvent) else None
+        return self._append(MessageRecord(event.message_id, event.time, event.self_id, group_id, event.user_id, event.raw_message))
+
+    def recall(self, message_id: int):
+        '''标记消息已被撤回'''
+        if record := self._index.get(message_id):
+            record.recalled = True
+
+    def get(self, message_id: int) -> MessageRecord|None:
+        '''根据`message_id`获取消息'''
+        if (record := self._index.get(message_id)) and record.time >= time.time() - self.max_age:
+            return record
+        return None
+
+    def group(self, group_id: int, limit: int|None = None) -> list[MessageRecord]:
+        '''获取群聊中的最近消息, 按时间顺序排列'''
+        return self._recent(self._chats.get(('group', group_id), ()), limit)
+
+    def private(self, user_id: int, limit: int|None = None) -> list[MessageRecord]:
+        '''获取私聊中的最近消息, 按时间顺序排列'''
+        return self._recent(self._chats.get(('private', user_id), ()), limit)
+
+    def user(self, user_id: int, group_id: int|None = None, limit: int|None = None) -> list[MessageRecord]:
+        '''获取用户的最近消息, 可以限定群聊'''
+        records = (self._index.get(message_id) for message_id in self._users.get(user_id, ()))
+        records = (r for r in records if r is not None and r.user_id == user_id and (group_id is None or r.group_id == group_id))
+        return self._recent(records, limit)
+
+    def prune(self):
+        '''清除所有会话中过期的消息和没有消息的会话'''
+        deadline = time.time() - self.max_age
+        for key, chat in list(self._chats.items()):
+            self._evict(chat, deadline, 0)
+            if not chat:
+                del self._chats[key]
+
+    def dump(self) -> list[tuple]:
+        '''导出所有消息记录'''
+        records = sorted((r for chat in self._chats.values() for r in chat), key=lambda r: r.time)
+        return [(r.message_id, r.time, r.self_id, r.group_id, r.user_id, r.raw_message, r.recalled) for r in records]
+
+    def load(self, records: list[tuple]):
+        if self.size <= 0:
+            return
+        deadline = time.time() - self.max_age
+        for message_id, time_, self_id, group_id, user_id, raw_message, recalled in records:
+            if time_ < deadline or message_id in self._index:
+                continue
+            record = self._append(MessageRecord(message_id, time_, self_id, group_id, user_id, raw_message))
+            record.recalled = recalled
+
+    def _recent(self, records: Iterable[MessageRecord], limit: int|None) -> list[MessageRecord]:
+        deadline = time.time() - self.max_age
+        result = [r for r in records if r.time >= deadline]
+        return result[-limit:] if limit else result
+
+    def _append(self, record: MessageRecord) -> MessageRecord:
+        key = ('group', record.group_id) if record.group_id is not None else ('private', record.user_id)
+        if (chat := self._chats.get(key)) is None:
+            chat = self._chats[key] = deque()
+            if len(self._chats) > self.max_chats:
+                self._evict(self._chats.popitem(last=False)[1], float('inf'), 0)
+        else:
+            self._chats.move_to_end(key)
+        self._evict(chat, record.time - self.max_age)
+        chat.append(record)
+        self._index[record.message_id] = record
+        if (user := self._users.get(record.user_id)) is None:
+            user = deque(maxlen=self.size)
+            self._users.set(record.user_id, user)
+        user.append(record.message_id)
+        return record
+
+    def _evict(self, chat: deque[MessageRecord], deadline: float, room: int = 1):
+        while chat and (len(chat) > self.size - room or chat[0].time < deadline):
+            record = chat.popleft()
+            if self._index.get(record.message_id) is record:
+                del self._index[record.message_id]
+
+
+__all__ = [
+    'History',
+    'MessageRecord',
+]
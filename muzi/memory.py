@@ -0,0 +1,173 @@
+import asyncio
+import itertools
+import os
+import sys
+import time
+import tracemalloc
+from collections import deque
+from typing import TYPE_CHECKING, Any, Iterable
+
+from .log import logger
+
+if TYPE_CHECKING:
+    from .bot import Bot
+
+
+class MemoryMonitor:
+    '''
+    内存统计
+    * 使用 tracemalloc 记录内存分配, 按分配所在的文件归属到插件, 其余归属到`muzi`或`other`
+    * 每隔`interval`秒记录一次快照, 保留最近`samples`次; 在所有快照中持续增长且增量超过`threshold`字节的插件会被报告
+    * tracemalloc 本身会带来明显的开销, 仅在需要排查时启用
+    '''
+
+    def __init__(self, bot: 'Bot', interval: float = 600, samples: int = 6, threshold: int = 1048576, frames: int = 1):
+        self.bot = bot
+        self.interval = interval
+        self.threshold = threshold
+        self.frames = frames
+        self.history: deque[tuple[float, dict[str, int]]] = deque(maxlen=samples)
+        self._owners: dict[str, str] = {}
+        self._paths: list[tuple[str, str]] = []
+        self._package = os.path.dirname(os.path.abspath(__file__)) + os.sep
+
+    async def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        self.bot.scheduler.call_every(self.interval, self.sample)
+        logger.info(f'<y>MemoryMonitor</y> is tracing allocations, sampling every <c>{self.interval}</c>s.')
+
+    async def close(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    async def snapshot(self) -> dict[str, int]:
+        '''当前按插件统计的内存占用(字节)'''
+        if not tracemalloc.is_tracing():
+            return {}
+        snapshot = await asyncio.to_thread(tracemalloc.take_snapshot)
+        stats = await asyncio.to_thread(snapshot.statistics, 'filename')
+        owners = self._plugin_paths()
+        sizes: dict[str, int] = {}
+        for stat in stats:
+            owner = self._owner(stat.traceback[0].filename, owners)
+            sizes[owner] = sizes.get(owner, 0) + stat.size
+        return sizes
+
+    async def sample(self):
+        self.history.append((time.time(), await self.snapshot()))
+        for path, growth in self.growing().items():
+            logger.warning(f'<y>MemoryMonitor</y> plugin [<y>{path}</y>] <r>keeps growing</r> (+<c>{growth/1048576:.2f}</c>MiB over {len(self.history)} samples).')
+
+    def growing(self) -> dict[str, int]:
+        '''在所有快照中持续增长的插件及其增量'''
+        if len(self.history) < 3:
+            return {}
+        samples = [sizes for _, sizes in self.history]
+        result = {}
+        for path in samples[-1]:
+            series = [sizes.get(path, 0) for sizes in samples]
+            if all(a < b for a, b in zip(series, series[1:])) and series[-1] - series[0] >= self.threshold:
+                result[path] = series[-1] - series[0]
+        return result
+
+    def framework(self) -> dict[str, dict[str, int]]:
+        '''
+        框架内部结构的条目数与估算的字节数
+        * 字节数由容器本身与最多`SAMPLE`个条目的平均大小估算, 只计算到两层嵌套
+        '''
+        bot = self.bot
+        server = bot.server
+        containers: dict[str, tuple[int, list]] = {
+            'api_result': (len(server._api_result), [server._api_result]),
+            'tasks': (len(tasks := asyncio.all_tasks()), [tasks]),
+            'history': (len(bot.history), [bot.history._index]),
+            'sessions': (len(bot.sessions), [bot.sessions._waiters]),
+            'scheduler_jobs': (len(bot.scheduler._jobs), [bot.scheduler._jobs]),
+            'storage_cache': (len(bot.storage._cache), [bot.storage._cache]),
+            'storage_pending': (len(bot.storage._pending), [bot.storage._pending]),
+            'dedup': (len(server.deduplicator.cache), [server.deduplicator.cache._data]),
+        }
+        if bot.admission is not None:
+            containers['admission_pending'] = (sum(bot.admission.pending.values()), list(bot.admission._queues))
+        caches = [executor.cache.cache._data for plugin in bot.plugins for trigger in plugin.triggers for executor in trigger.executors if executor.cache is not None]
+        if caches:
+            containers['result_cache'] = (sum(map(len, caches)), caches)
+        return {name: {'count': count, 'bytes': sum(map(_estimate, items))} for name, (count, items) in containers.items()}
+
+    async def report(self) -> dict:
+        current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        plugins = await self.snapshot()
+        return {
+            'tracing': tracemalloc.is_tracing(),
+            'traced': current,
+            'peak': peak,
+            'plugins': dict(sorted(plugins.items(), key=lambda i: i[1], reverse=True)),
+            'framework': self.framework(),
+            'growing': self.growing(),
+        }
+
+    async def format_report(self, limit: int = 10) -> str:
+        report = await self.report()
+        lines = [f'traced: {report["traced"]/1048576:.2f}MiB (peak {report["peak"]/1048576:.2f}MiB)']
+        lines.extend(f'{path}: {size/1048576:.2f}MiB' for path, size in list(report['plugins'].items())[:limit])
+        lines.append(' '.join(f'{k}={v["count"]}({v["bytes"]/1024:.0f}KiB)' for k, v in report['framework'].items()))
+        if report['growing']:
+            lines.append('growing: ' + ', '.join(f'{path} +{size/1048576:.2f}MiB' for path, size in report['growing'].items()))
+        return '\n'.join(lines)
+
+    def _plugin_paths(self) -> list[tuple[str, str]]:
+        paths = []
+        for plugin in self.bot.plugins:
+            if plugin.module is None or not (file := getattr(plugin.module, '__file__', None)):
+                continue
+            file = os.path.abspath(file)
+            if os.path.basename(file) == '__init__.py':
+                file = os.path.dirname(file) + os.sep
+            paths.append((file, plugin.module_path))
+        paths.sort(key=lambda p: len(p[0]), reverse=True)
+        if paths != self._paths:
+            self._paths = paths
+            self._owners.clear()
+        return paths
+
+    def _owner(self, filename: str, paths: list[tuple[str, str]]) -> str:
+        if (owner := self._owners.get(filename)) is None:
+            file = os.path.abspath(filename)
+            owner = next((module_path for path, module_path in paths if file.startswith(path)), None)
+            if owner is None:
+                owner = 'muzi' if file.startswith(self._package) else 'other'
+            self._owners[filename] = owner
+        return owner
+
+
+SAMPLE = 100
+
+def _sizeof(obj: Any, depth: int = 2) -> int:
+    size = sys.getsizeof(obj)
+    if depth <= 0:
+        return size
+    if isinstance(obj, dict):
+        children: Iterable = itertools.chain(obj.keys(), obj.values())
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        children = obj
+    elif (slots := getattr(type(obj), '__slots__', None)) is not None and not hasattr(obj, '__dict__'):
+        children = (getattr(obj, slot, None) for slot in ((slots,) if isinstance(slots, str) else slots))
+    elif hasattr(obj, '__dict__'):
+        children = (vars(obj),)
+    else:
+        return size
+    return size + sum(_sizeof(child, depth - 1) for child in children)
+
+def _estimate(container: Any) -> int:
+    '''容器本身的大小加上抽样条目的平均大小乘以条目数'''
+    if not (count := len(container)):
+        return sys.getsizeof(container)
+    entries = container.items() if isinstance(container, dict) else container
+    sample = list(itertools.islice(entries, SAMPLE))
+    return sys.getsizeof(container) + sum(map(_sizeof, sample)) * count // len(sample)
+
+
+__all__ = [
+    'MemoryMonitor',
+]
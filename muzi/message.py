@@ -1,11 +1,66 @@
+import asyncio
 import re
+import sys
 from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from io import BytesIO
 from json import JSONEncoder as BaseJSONEncoder
 from pathlib import Path
-from typing import Union
+from typing import TYPE_CHECKING, Union
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+
+def _is_image(obj) -> bool:
+    # PIL 只在真正需要时导入, 未导入时不可能存在 PIL 图片
+    return (module := sys.modules.get('PIL.Image')) is not None and isinstance(obj, module.Image)
+
+
+class ImageEncoder:
+    '''
+    PIL 图片编码
+    * `format`: `PNG`, `JPEG` 或 `WEBP`
+    * `quality`: `JPEG`/`WEBP` 的质量
+    * `compress_level`: `PNG` 的压缩等级, 0-9
+    * `max_size`: 图片长边超过该值时等比缩小, `0` 表示不限制
+    * `workers`: 异步编码使用的线程数
+    '''
+
+    __slots__ = ('format', 'quality', 'compress_level', 'max_size', 'workers', '_executor')
+
+    def __init__(self, format: str = 'PNG', quality: int = 90, compress_level: int = 6, max_size: int = 0, workers: int = 2):
+        self.format = format
+        self.quality = quality
+        self.compress_level = compress_level
+        self.max_size = max_size
+        self.workers = workers
+        self._executor: ThreadPoolExecutor|None = None
+
+    def encode(self, image: 'Image.Image', format: str|None = None, quality: int|None = None, max_size: int|None = None) -> str:
+        '''将图片编码为`base64://`字符串'''
+        format = (format or self.format).upper()
+        max_size = self.max_size if max_size is None else max_size
+        if max_size and max(image.size) > max_size:
+            image = image.copy()
+            image.thumbnail((max_size, max_size))
+        io = BytesIO()
+        if format == 'PNG':
+            image.save(io, format='PNG', compress_level=self.compress_level)
+        else:
+            if format == 'JPEG' and image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            image.save(io, format=format, quality=quality or self.quality)
+        return 'base64://'+b64encode(io.getvalue()).decode()
+
+    async def encode_async(self, image: 'Image.Image', format: str|None = None, quality: int|None = None, max_size: int|None = None) -> str:
+        '''在线程池中编码图片, 不阻塞事件循环'''
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='muzi-image')
+        return await asyncio.get_running_loop().run_in_executor(self._executor, partial(self.encode, image, format, quality, max_size))
 
-from PIL import Image
+image_encoder = ImageEncoder()
 
 
 class CQcode:
@@ -77,17 +132,22 @@ class CQcode:
         return CQcode('face', {'id': id})
 
     @staticmethod
-    def image(file: str|Path|bytes|Image.Image):
+    def image(file: 'str|Path|bytes|Image.Image'):
         if isinstance(file, bytes):
             file = 'base64://'+b64encode(file).decode()
         elif isinstance(file, Path):
             file = file.resolve().as_uri()
-        elif isinstance(file, Image.Image):
-            io = BytesIO()
-            file.save(io, format='PNG')
-            file = 'base64://'+b64encode(io.getvalue()).decode()
+        elif _is_image(file):
+            file = image_encoder.encode(file)
         return CQcode('image', {'file': file})
 
+    @staticmethod
+    async def image_async(file: 'str|Path|bytes|Image.Image', format: str|None = None, quality: int|None = None, max_size: int|None = None):
+        '''在线程池中编码图片, 参数见`ImageEncoder`'''
+        if _is_image(file):
+            file = await image_encoder.encode_async(file, format, quality, max_size)
+        return CQcode.image(file)
+
     @staticmethod
     def music(type: str, id: str):
         return CQcode('music', {'type': type, 'id': id})
@@ -139,17 +199,22 @@ class CQcode:
         return CQcode('poke', {'qq': qq})
 
     @staticmethod
-    def cardimage(file: str|Path|bytes|Image.Image, minwidth: int = 400, minheight: int = 400, maxwidth: int = 500, maxheight: int = 1000, source: str = '', icon: str = ''):
+    def cardimage(file: 'str|Path|bytes|Image.Image', minwidth: int = 400, minheight: int = 400, maxwidth: int = 500, maxheight: int = 1000, source: str = '', icon: str = ''):
         if isinstance(file, bytes):
             file = 'base64://'+b64encode(file).decode()
         elif isinstance(file, Path):
             file = file.resolve().as_uri()
-        elif isinstance(file, Image.Image):
-            io = BytesIO()
-            file.save(io, format='PNG')
-            file = 'base64://'+b64encode(io.getvalue()).decode()
+        elif _is_image(file):
+            file = image_encoder.encode(file)
         return CQcode('cardimage', {'file': file, 'minwidth': minwidth, 'minheight': minheight, 'maxwidth': maxwidth, 'maxheight': maxheight, 'source': source, 'icon': icon})
 
+    @staticmethod
+    async def cardimage_async(file: 'str|Path|bytes|Image.Image', minwidth: int = 400, minheight: int = 400, maxwidth: int = 500, maxheight: int = 1000, source: str = '', icon: str = '', format: str|None = None, quality: int|None = None, max_size: int|None = None):
+        '''在线程池中编码图片, 参数见`ImageEncoder`'''
+        if _is_image(file):
+            file = await image_encoder.encode_async(file, format, quality, max_size)
+        return CQcode.cardimage(file, minwidth, minheight, maxwidth, maxheight, source, icon)
+
     @staticmethod
     def tts(text: str):
         return CQcode('tts', {'text': text})
@@ -1,4 +1,9 @@
 from .executor import *
+from .limiter import *
+from .matcher import *
 from .plugin import *
+from .session import *
+from .switch import *
 from .trigger import *
-from .condition import *
\ No newline at end of file
+from .condition import *
+from .watcher import *
\ No newline at end of file
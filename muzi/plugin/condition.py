@@ -1,39 +1,58 @@
 import asyncio
-from typing import Callable
+from typing import Callable, Iterable
 
 from .executor import Executor
 
 Checker = Callable[..., bool]
 
 class Condition:
+    '''
+    * `checkers`同时执行, 全部通过时条件成立
+    * `stateful`中的检查器在通过时会改变状态(如`rate_limit`计数), 只在其余检查器都通过后依次执行
+    '''
 
-    __slots__ = ('checkers')
+    __slots__ = ('checkers', 'stateful')
     
-    def __init__(self, *checkers: Checker|Executor):
+    def __init__(self, *checkers: Checker|Executor, stateful: Iterable[Checker|Executor] = ()):
         self.checkers = [checker if isinstance(checker, Executor) else Executor.new(checker) for checker in checkers] #type: ignore
+        self.stateful = [checker if isinstance(checker, Executor) else Executor.new(checker) for checker in stateful] #type: ignore
     
     async def __call__(self, *args):
+        return await self.check(*args) and await self.consume(*args)
+
+    async def check(self, *args):
+        '''执行无状态的检查器'''
         try:
             result = all(await asyncio.gather(*(exc(*args) for exc in self.checkers)))
         except Exception:
             result = False
         return result
+
+    async def consume(self, *args):
+        '''依次执行有状态的检查器, 遇到不通过的检查器时停止'''
+        try:
+            for exc in self.stateful:
+                if not await exc(*args):
+                    return False
+        except Exception:
+            return False
+        return True
     
     def __and__(self, other):
         if other is None:
             return self
         elif isinstance(other, Condition):
-            return Condition(*self.checkers, *other.checkers)
+            return Condition(*self.checkers, *other.checkers, stateful=(*self.stateful, *other.stateful))
         else:
-            return Condition(*self.checkers, other)
+            return Condition(*self.checkers, other, stateful=self.stateful)
         
     def __rand__(self, other):
         if other is None:
             return self
         elif isinstance(other, Condition):
-            return Condition(*other.checkers, *self.checkers)
+            return Condition(*other.checkers, *self.checkers, stateful=(*other.stateful, *self.stateful))
         else:
-            return Condition(other, *self.checkers)
+            return Condition(other, *self.checkers, stateful=self.stateful)
 
 __all__ = [
     'Condition',
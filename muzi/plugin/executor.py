@@ -1,12 +1,89 @@
+import asyncio
 import inspect
 from dataclasses import dataclass, field
-from typing import Iterable, Callable
+from typing import Any, Awaitable, Callable, Hashable, Iterable
+
+from ..event import Event
+from ..utils import _MISSING, LRUCache
+
+
+class ResultCache:
+    '''
+    执行结果缓存
+    * 以规范化后的`current_result`和`fields`中的事件字段作为键, 结果保留`ttl`秒, 最多`maxsize`项
+    * 相同的键正在计算时, 之后的调用会等待同一次计算的结果; 该次计算被取消时等待的调用会重新计算
+    * 计算抛出异常时结果不会被缓存
+    '''
+
+    __slots__ = ('fields', 'cache', 'hits', 'misses', '_inflight')
+
+    def __init__(self, ttl: float, maxsize: int = 256, fields: Iterable[str] = ()):
+        self.fields = tuple(fields)
+        self.cache = LRUCache(maxsize, ttl)
+        self.hits = 0
+        self.misses = 0
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+
+    def key(self, args: tuple) -> Hashable:
+        result = next((arg for arg in args if isinstance(arg, dict)), None)
+        event = next((arg for arg in args if isinstance(arg, Event)), None)
+        return (_freeze(result), tuple(getattr(event, f, None) for f in self.fields))
+
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        while (future := self._inflight.get(key)) is not None:
+            self.hits += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+        if (value := self.cache.get(key, _MISSING)) is not _MISSING:
+            self.hits += 1
+            return value
+        self.misses += 1
+        future = self._inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            value = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        else:
+            self.cache.set(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            del self._inflight[key]
+
+    def clear(self):
+        self.cache.clear()
+
+
+def _freeze(value: Any) -> Hashable:
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(_freeze(v) for v in value)
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
+    return value
+
 
 @dataclass(eq=False, frozen=True)
 class Executor:
     func: Callable
     pre_excute: Iterable[Callable] = field(default_factory=list)
     params_annotation: Iterable = field(default_factory=tuple)
+    cache: ResultCache|None = None
 
     async def __call__(self, *args):
         for pre in self.pre_excute:
@@ -15,6 +92,11 @@ class Executor:
             else:
                 pre(*(self.get_params(pre, args)))
 
+        if self.cache is not None:
+            return await self.cache.run(self.cache.key(args), lambda: self._call(args))
+        return await self._call(args)
+
+    async def _call(self, args: tuple):
         if inspect.iscoroutinefunction(self.func):
             result = await self.func(*(self.get_params(self.func, args)))
         else:
@@ -22,10 +104,10 @@ class Executor:
         return result
 
     @classmethod
-    def new(cls, func: Callable, pre_excute: Iterable[Callable]|None = None):
+    def new(cls, func: Callable, pre_excute: Iterable[Callable]|None = None, cache: ResultCache|None = None):
         pre_excute = list() if pre_excute is None else pre_excute
         params_annotation = tuple(cls.get_annotations(func))
-        return cls(func, pre_excute, params_annotation)
+        return cls(func, pre_excute, params_annotation, cache)
     
     @staticmethod
     def get_annotations(func: Callable):
@@ -43,4 +125,5 @@ class Executor:
 
 __all__ = [
     'Executor',
+    'ResultCache',
 ]
\ No newline at end of file
@@ -0,0 +1,75 @@
+import asyncio
+from typing import Any, Callable, Coroutine
+
+OVERFLOW = ('queue', 'shed')
+
+class Limiter:
+    '''
+    并发限制与执行超时
+    * `max_concurrency`: 最大并发执行数, `0` 表示不限制
+    * `timeout`: 单次执行的超时时间(秒), `0` 表示不限制
+    * `overflow`: 达到并发上限时的策略, `queue` 排队等待, `shed` 直接丢弃
+    '''
+
+    __slots__ = ('max_concurrency', 'timeout', 'overflow', 'stats', '_semaphore')
+
+    def __init__(self, max_concurrency: int = 0, timeout: float = 0, overflow: str = 'queue'):
+        if overflow not in OVERFLOW:
+            raise ValueError(f'overflow must be one of {OVERFLOW}, got {overflow!r}')
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.overflow = overflow
+        self.stats = {'executed': 0, 'queued': 0, 'shed': 0, 'timeout': 0}
+        self._semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency > 0 else None
+
+    @property
+    def settings(self):
+        return (self.max_concurrency, self.timeout, self.overflow)
+
+    @property
+    def running(self) -> int:
+        '''正在执行的数量'''
+        if self._semaphore is None:
+            return 0
+        return self.max_concurrency - self._semaphore._value
+
+    async def run(self, func: Callable[[], Coroutine[Any, Any, Any]]) -> bool:
+        '''
+        在限制下执行`func`
+        * 返回`False`表示因达到并发上限被丢弃
+        * 超时时抛出`asyncio.TimeoutError`
+        '''
+        semaphore = self._semaphore
+        if semaphore is not None:
+            if semaphore.locked():
+                if self.overflow == 'shed':
+                    self.stats['shed'] += 1
+                    return False
+                self.stats['queued'] += 1
+            await semaphore.acquire()
+        try:
+            self.stats['executed'] += 1
+            if self.timeout > 0:
+                try:
+                    await asyncio.wait_for(func(), self.timeout)
+                except asyncio.TimeoutError:
+                    self.stats['timeout'] += 1
+                    raise
+            else:
+                await func()
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+        return True
+
+    @classmethod
+    def new(cls, max_concurrency: int = 0, timeout: float = 0, overflow: str = 'queue'):
+        '''无任何限制时返回`None`'''
+        if max_concurrency <= 0 and timeout <= 0:
+            return None
+        return cls(max_concurrency, timeout, overflow)
+
+
+__all__ = [
+    'Limiter',
+]
@@ -0,0 +1,112 @@
+from collections import deque
+from typing import Any, Iterable, Iterator
+
+
+class CommandTrie:
+    '''
+    命令前缀树
+    * 同一个命令可以对应多个值
+    * `match` 从文本开头查找所有已注册的命令, 耗时只与命令长度有关
+    '''
+
+    __slots__ = ('_root',)
+
+    def __init__(self):
+        self._root: dict = {}
+
+    def insert(self, command: str, value: Any):
+        node = self._root
+        for char in command:
+            node = node.setdefault(char, {})
+        node.setdefault(None, []).append(value)
+
+    def remove(self, command: str, value: Any):
+        path = [self._root]
+        for char in command:
+            if (node := path[-1].get(char)) is None:
+                return
+            path.append(node)
+        if (values := path[-1].get(None)) is None:
+            return
+        values[:] = [v for v in values if v is not value]
+        if not values:
+            del path[-1][None]
+        for char, parent, node in zip(reversed(command), reversed(path[:-1]), reversed(path[1:])):
+            if node:
+                break
+            del parent[char]
+
+    def match(self, text: str) -> list[tuple[int, list]]:
+        '''返回所有匹配命令的长度与对应的值, 较长的命令在前'''
+        node = self._root
+        matches = []
+        for i, char in enumerate(text):
+            if (node := node.get(char)) is None:
+                break
+            if None in node:
+                matches.append((i + 1, node[None]))
+        matches.reverse()
+        return matches
+
+
+class AhoCorasick:
+    '''
+    Aho-Corasick 自动机
+    * 构建后不可修改, 关键词变化时应重新构建并整体替换
+    * 一次线性扫描即可找出文本中出现的所有关键词
+    '''
+
+    __slots__ = ('keywords', '_goto', '_fail', '_output')
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords = frozenset(k for k in keywords if k)
+        goto: list[dict[str, int]] = [{}]
+        output: list[tuple[str, ...]] = [()]
+        for keyword in self.keywords:
+            state = 0
+            for char in keyword:
+                if (next_state := goto[state].get(char)) is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    output.append(())
+                state = next_state
+            output[state] = (keyword,)
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                f = fail[state]
+                while f and char not in goto[f]:
+                    f = fail[f]
+                fail[next_state] = goto[f].get(char, 0)
+                output[next_state] += output[fail[next_state]]
+        self._goto = goto
+        self._fail = fail
+        self._output = output
+
+    def __len__(self):
+        return len(self.keywords)
+
+    def iter(self, text: str) -> Iterator[tuple[int, str]]:
+        '''依次产生`(起始位置, 关键词)`'''
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for keyword in output[state]:
+                yield i - len(keyword) + 1, keyword
+
+    def findall(self, text: str) -> list[str]:
+        '''返回出现过的关键词, 按首次出现的顺序去重'''
+        return list(dict.fromkeys(keyword for _, keyword in self.iter(text)))
+
+
+__all__ = [
+    'AhoCorasick',
+    'CommandTrie',
+]
@@ -1,11 +1,21 @@
+import asyncio
 import importlib
+import importlib.util
 import inspect
+import json
 import os
-from dataclasses import dataclass
+import re
+import sys
+import time
+from dataclasses import dataclass, field
 from types import ModuleType
-from typing import Callable
+from typing import Callable, Type
 
+from .. import event as _event
+from ..event import Event, MessageEvent
 from ..log import logger
+from ..utils import collect_disposers
+from .limiter import Limiter
 from .trigger import Trigger, current_bot
 
 
@@ -18,6 +28,9 @@ class PluginMetadata:
     status_tracing: Callable[..., dict]|None = None
     type: int = 0
     hide: bool = False
+    max_concurrency: int = 0
+    timeout: float = 0
+    overflow: str = 'queue'
 
     @property
     def status(self):
@@ -32,9 +45,41 @@ class PluginMetadata:
         return self.status.get('risk', False)
 
 
+@dataclass(eq=False)
+class PluginManifest:
+    '''
+    插件清单, 用于在不导入插件的情况下声明其触发条件
+    * `events`: 插件关心的事件类型
+    * `patterns`: 消息需满足的正则
+    * `commands`: 消息需满足的前缀
+    '''
+    events: tuple[Type[Event], ...] = (Event,)
+    patterns: tuple[re.Pattern, ...] = ()
+    commands: tuple[str, ...] = ()
+    metadata: dict = field(default_factory=dict)
+
+    @classmethod
+    def parse(cls, data: dict):
+        patterns = tuple(re.compile(p, re.S) for p in data.get('regex', ()))
+        commands = tuple(data.get('commands', ()))
+        default_event = 'MessageEvent' if patterns or commands else 'Event'
+        events = tuple(getattr(_event, name) for name in data.get('events', (default_event,)))
+        return cls(events, patterns, commands, data.get('metadata', {}))
+
+    def match(self, event: Event) -> bool:
+        if not isinstance(event, self.events):
+            return False
+        if not (self.patterns or self.commands):
+            return True
+        if not isinstance(event, MessageEvent):
+            return False
+        text = event.raw_message
+        return text.startswith(self.commands) or any(p.search(text) for p in self.patterns)
+
+
 @dataclass(eq=False)
 class Plugin:
-    module: ModuleType
+    module: ModuleType|None
     module_path: str
     triggers: list[Trigger]
 
@@ -42,32 +87,174 @@ class Plugin:
 
     enable: bool = True
 
-    def reload(self):
-        self.module = importlib.reload(self.module)
-        logger.success(f'<g>Plugin</g> [<y>{self.module_path}</y>] reloads successfully!')
+    manifest: PluginManifest|None = None
+    load_time: float = 0
+    limiter: Limiter|None = None
+
+    _loading: asyncio.Future|None = field(default=None, repr=False)
+    _disposers: list[Callable] = field(default_factory=list, repr=False)
+
+    def __post_init__(self):
+        self._update_limiter()
+
+    def _update_limiter(self):
+        settings = (self.metadata.max_concurrency, self.metadata.timeout, self.metadata.overflow)
+        if self.limiter is None or self.limiter.settings != settings:
+            self.limiter = Limiter.new(*settings)
+
+    @property
+    def storage(self):
+        '''插件专属的存储命名空间'''
+        return current_bot.get().storage.namespace(self.module_path)
+
+    @property
+    def lazy(self) -> bool:
+        '''插件是否尚未导入'''
+        return self.module is None
+
+    async def load(self):
+        '''导入延迟加载的插件, 多次调用只会导入一次'''
+        if not self.lazy:
+            return
+        if self._loading is None:
+            self._loading = asyncio.ensure_future(self._load())
+        await asyncio.shield(self._loading)
+
+    async def _load(self):
+        bot = current_bot.get()
+        allow_load_plugin_without_trigger = bot.config.extra_config['allow_load_plugin_without_trigger']
+        hide_plugin_without_trigger = bot.config.extra_config['hide_plugin_without_trigger']
+        plugin = await asyncio.to_thread(get_plugin, self.module_path, allow_load_plugin_without_trigger, hide_plugin_without_trigger)
+        if plugin is None:
+            self.enable = False
+            return
+        self.triggers = plugin.triggers
+        self.metadata = plugin.metadata
+        self._disposers = plugin._disposers
+        self._update_limiter()
+        self.load_time = plugin.load_time
+        self.module = plugin.module
+        bot.refresh_subscriptions()
+        logger.success(f'<g>Plugin</g> [<y>{self.module_path}</y>] lazy loads successfully! <c>({self.load_time*1000:.1f}ms)</c>')
+
+    def reload(self) -> bool:
+        '''
+        重新导入插件并原子地替换其触发器
+        * 插件及其子模块被执行到新的模块对象中, 正在执行的旧触发器仍使用旧模块, 新事件将交由新触发器处理
+        * 旧模块注册的`on_startup`, `on_connect`等钩子与计划任务会被移除
+        * 导入失败时保留旧模块与旧触发器
+        * 导入在当前线程中进行, 在事件循环中可以使用`areload`
+        '''
+        if self.lazy:
+            return False
+        disposers: list[Callable] = []
+        try:
+            result = self._reimport(disposers)
+        except Exception as e:
+            return self._reload_failed(disposers, e)
+        return self._replace(disposers, *result)
+
+    async def areload(self) -> bool:
+        '''与`reload`相同, 但导入在线程中进行, 不阻塞事件循环'''
+        if self.lazy:
+            return False
+        disposers: list[Callable] = []
+        try:
+            result = await asyncio.to_thread(self._reimport, disposers)
+        except Exception as e:
+            return self._reload_failed(disposers, e)
+        return self._replace(disposers, *result)
+
+    def _reload_failed(self, disposers: list[Callable], e: Exception) -> bool:
+        for dispose in disposers:
+            dispose()
+        logger.error(f'<g>Plugin</g> [<y>{self.module_path}</y>] reloads failed!\n<r>{e}</r>')
+        return False
+
+    def _replace(self, disposers: list[Callable], module: ModuleType, triggers: list[Trigger], metadata: 'PluginMetadata', load_time: float) -> bool:
+        old_triggers, old_disposers = self.triggers, self._disposers
+        self.module, self.triggers, self.metadata, self.load_time, self._disposers = module, triggers, metadata, load_time, disposers
+        self._update_limiter()
+        for trigger in old_triggers:
+            trigger._dispose()
+        for dispose in old_disposers:
+            dispose()
+        if bot := current_bot.get(None):
+            bot.refresh_subscriptions()
+        logger.success(f'<g>Plugin</g> [<y>{self.module_path}</y>] reloads successfully! <c>({load_time*1000:.1f}ms)</c>')
+        return True
+
+    def _reimport(self, disposers: list[Callable]):
+        names = sorted((n for n, m in sys.modules.items() if n.startswith(self.module_path+'.') and m is not None), key=lambda n: -n.count('.'))
+        names.append(self.module_path)
+        old_modules = {name: sys.modules[name] for name in names}
+        with collect_disposers(disposers):
+            start = time.perf_counter()
+            try:
+                for name in names:
+                    _exec_fresh(old_modules[name])
+            except BaseException:
+                _install_modules(old_modules)
+                raise
+            module = sys.modules[self.module_path]
+            load_time = time.perf_counter() - start
+            triggers = _get_triggers(module)
+        metadata = PluginMetadata(**_get_metadata(module, self.module_path)) if triggers else self.metadata
+        return module, triggers, metadata, load_time
 
     def disable(self, v: bool = True):
         self.enable = not v
 
 
+def _exec_fresh(old: ModuleType) -> ModuleType:
+    '''以旧模块的 spec 将模块代码执行到一个新的模块对象中, 旧模块的全局变量不受影响'''
+    spec = old.__spec__
+    module = importlib.util.module_from_spec(spec) # type: ignore
+    _install_modules({spec.name: module}) # type: ignore
+    spec.loader.exec_module(module) # type: ignore
+    return module
+
+def _install_modules(modules: dict[str, ModuleType]):
+    for name, module in modules.items():
+        sys.modules[name] = module
+        parent, _, child = name.rpartition('.')
+        if parent and (package := sys.modules.get(parent)) is not None:
+            setattr(package, child, module)
+
+def _get_triggers(module: ModuleType) -> list[Trigger]:
+    instances = inspect.getmembers(module, lambda x: (isinstance(x, Trigger)))
+    bot = current_bot.get(None)
+    for name, trigger in instances:
+        trigger._instance_name = name
+        if bot is None:
+            continue
+        for index, executor in enumerate(trigger.executors):
+            if executor.cache is not None:
+                bot.snapshot.register(f'muzi.result_cache.{module.__name__}.{name}.{index}', executor.cache.cache.dump, executor.cache.cache.load)
+    return sorted([t[1] for t in instances], key=lambda t: t.priority)
+
+def _get_metadata(module: ModuleType, path: str) -> dict:
+    default_metadata = {'name': path.split('.')[-1]}
+    if custom_metadata := getattr(module, '__metadata__', None):
+        default_metadata.update(custom_metadata)
+    return default_metadata
+
 def get_plugin(path: str, allow_load_plugin_without_trigger: bool = False, hide_plugin_without_trigger: bool = True):
     try:
-        module = importlib.import_module(path)
-        if instances := inspect.getmembers(module, lambda x: (isinstance(x, Trigger))):
-            for name, trigger in instances:
-                trigger._instance_name = name
-            default_metadata = {'name': path.split('.')[-1]}
-            if custom_metadata := getattr(module, '__metadata__', None):
-                default_metadata.update(custom_metadata)
-            triggers:list[Trigger] = sorted([t[1] for t in instances], key=lambda t: t.priority)
-            metadata = PluginMetadata(**default_metadata)
-            return Plugin(module, path, triggers, metadata)
+        with collect_disposers([]) as disposers:
+            start = time.perf_counter()
+            module = importlib.import_module(path)
+            load_time = time.perf_counter() - start
+            triggers = _get_triggers(module)
+        if triggers:
+            metadata = PluginMetadata(**_get_metadata(module, path))
+            return Plugin(module, path, triggers, metadata, load_time=load_time, _disposers=disposers)
         elif allow_load_plugin_without_trigger:
-            default_metadata = {'name': path.split('.')[-1], 'hide': len(instances)<=hide_plugin_without_trigger, 'enable': len(instances)>0}
+            default_metadata = {'name': path.split('.')[-1], 'hide': len(triggers)<=hide_plugin_without_trigger, 'enable': len(triggers)>0}
             if custom_metadata := getattr(module, '__metadata__', None):
                 default_metadata.update(custom_metadata)
             metadata = PluginMetadata(**default_metadata)
-            return Plugin(module, path, list(), metadata)
+            return Plugin(module, path, list(), metadata, load_time=load_time, _disposers=disposers)
         else:
             logger.warning(f'<g>Plugin</g> [<y>{path}</y>] 0 trigger was detected!')
     except:
@@ -80,22 +267,59 @@ def load_plugin(path: str):
     if plugin := get_plugin(path, allow_load_plugin_without_trigger, hide_plugin_without_trigger):
         bot.plugins.append(plugin)
         bot.plugins.sort(key=lambda p: p.metadata.name)
-        logger.success(f'<g>Plugin</g> [<y>{path}</y>] loads successfully!')
+        bot.refresh_subscriptions()
+        logger.success(f'<g>Plugin</g> [<y>{path}</y>] loads successfully! <c>({plugin.load_time*1000:.1f}ms)</c>')
 
-def load_plugin_dir(path: str):
+def load_lazy_plugin(path: str, manifest: PluginManifest):
+    '''
+    ## 延迟加载插件
+    * 插件在第一个满足清单的事件到达时才会被导入
+    '''
+    bot = current_bot.get()
+    default_metadata = {'name': path.split('.')[-1]}
+    default_metadata.update(manifest.metadata)
+    plugin = Plugin(None, path, list(), PluginMetadata(**default_metadata), manifest=manifest)
+    bot.plugins.append(plugin)
+    bot.plugins.sort(key=lambda p: p.metadata.name)
+    bot.refresh_subscriptions()
+    logger.success(f'<g>Plugin</g> [<y>{path}</y>] is registered for lazy loading.')
+
+def load_plugin_dir(path: str, lazy: bool = False, manifest: str = 'manifest.json'):
+    '''
+    ## 加载目录下的所有插件
+    * `lazy`: 是否延迟加载 `manifest` 中声明的插件
+    * `manifest`: 插件清单文件名, 格式为 `{插件名: {"events": [...], "regex": [...], "commands": [...]}}`
+    '''
+    bot = current_bot.get()
+    manifests = dict()
+    if lazy and os.path.isfile(manifest_path := os.path.join(path, manifest)):
+        with open(manifest_path, 'r', encoding='UTF-8') as f:
+            manifests = {name: PluginManifest.parse(data) for name, data in json.load(f).items()}
     file_list = os.listdir(path)
-    module_path = path.rstrip('/').lstrip('.').replace('/', '.')+'.'
+    module_path = os.path.normpath(path).replace(os.sep, '.').lstrip('.')+'.'
+    start = time.perf_counter()
     for file in file_list:
-        if not file.startswith('__'):
-            if file.endswith('.py'):
-                load_plugin(module_path+file[:-3])
+        if not file.startswith('__') and file != manifest:
+            name = file[:-3] if file.endswith('.py') else file
+            if name in manifests:
+                load_lazy_plugin(module_path+name, manifests[name])
             else:
-                load_plugin(module_path+file)
+                load_plugin(module_path+name)
+    logger.info(f'<g>Plugin</g> directory [<y>{path}</y>] loads in <c>{(time.perf_counter()-start)*1000:.1f}ms</c>.')
+    if manifests and bot.config.extra_config['lazy_plugin_preload']:
+        async def preload():
+            async def _preload():
+                for plugin in [p for p in bot.plugins if p.lazy and p.enable]:
+                    await plugin.load()
+            asyncio.create_task(_preload())
+        bot.on_startup(preload)
 
 
 __all__ = [
     'Plugin',
+    'PluginManifest',
     'PluginMetadata',
+    'load_lazy_plugin',
     'load_plugin',
     'load_plugin_dir',
 ]
\ No newline at end of file
@@ -0,0 +1,64 @@
+import asyncio
+from typing import Optional, Type
+
+from ..event import Event
+
+SessionKey = tuple[int, Optional[int], Optional[int]]
+
+def session_key(event: Event) -> SessionKey:
+    return (event.self_id, getattr(event, 'group_id', None), getattr(event, 'user_id', None))
+
+
+class SessionIndex:
+    '''
+    等待中的会话
+    * 以 `(self_id, group_id, user_id)` 为键, 每个会话同时只有一个等待者
+    '''
+
+    __slots__ = ('_waiters',)
+
+    def __init__(self):
+        self._waiters: dict[SessionKey, tuple[asyncio.Future, Type[Event]]] = {}
+
+    def __len__(self):
+        return len(self._waiters)
+
+    def wait(self, key: SessionKey, event: Type[Event]) -> asyncio.Future:
+        '''创建等待者, 已有的等待者会收到`None`'''
+        if (waiter := self._waiters.get(key)) and not waiter[0].done():
+            waiter[0].set_result(None)
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[key] = (future, event)
+        return future
+
+    def discard(self, key: SessionKey, future: asyncio.Future):
+        if (waiter := self._waiters.get(key)) and waiter[0] is future:
+            del self._waiters[key]
+
+    def waiting(self, event: Event) -> bool:
+        '''是否有会话在等待该事件'''
+        if not self._waiters or (waiter := self._waiters.get(session_key(event))) is None:
+            return False
+        return not waiter[0].done() and isinstance(event, waiter[1])
+
+    def feed(self, event: Event) -> bool:
+        '''将事件交给等待中的会话, 返回事件是否被会话消费'''
+        if not self._waiters:
+            return False
+        key = session_key(event)
+        if (waiter := self._waiters.get(key)) is None:
+            return False
+        future, event_type = waiter
+        if not isinstance(event, event_type):
+            return False
+        del self._waiters[key]
+        if future.done():
+            return False
+        future.set_result(event)
+        return True
+
+
+__all__ = [
+    'SessionIndex',
+    'session_key',
+]
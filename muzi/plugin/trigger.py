@@ -1,13 +1,19 @@
 import asyncio
+import json
 import re
 from contextvars import ContextVar
-from typing import TYPE_CHECKING, Callable, Iterable, NoReturn, Type
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Iterable, NoReturn, Type
 
 from ..event import Event, MessageEvent
 from ..exception import ExecuteDone
 from ..message import CQcode, Message
+from ..trace import tracer
 from .condition import Condition
-from .executor import Executor
+from .executor import Executor, ResultCache
+from .limiter import Limiter
+from .matcher import AhoCorasick, CommandTrie
+from .session import session_key
 
 if TYPE_CHECKING:
     from ..bot import Bot
@@ -16,9 +22,12 @@ current_bot: ContextVar['Bot'] = ContextVar('current_bot')
 current_event: ContextVar[Event] = ContextVar('current_event')
 current_result: ContextVar[dict] = ContextVar('current_result')
 
+_command_trie = CommandTrie()
+_command_match: ContextVar[tuple[Event, tuple[int, list]]] = ContextVar('_command_match')
+
 class Trigger:
 
-    __slots__ = ('detector', 'event', 'condition', 'priority', 'block', 'executors', '_instance_name')
+    __slots__ = ('detector', 'event', 'condition', 'priority', 'block', 'executors', 'limiter', '_instance_name')
 
     def __init__(self, detector: Callable[..., bool], event: Type[Event] = Event, condition: Condition|None = None, priority: int = 1, block: bool = False):
         self.detector = Executor.new(detector)
@@ -26,30 +35,56 @@ class Trigger:
         self.condition: Condition = condition or Condition()
         self.priority: int = priority
         self.executors: list[Executor]  = []
+        self.limiter: Limiter|None = None
         self._instance_name: str = ''
         self.block: bool = block
 
-    def excute(self, func: Callable|None = None, pre_excute: Iterable[Callable]|None = None) -> Callable:
+    def limit(self, max_concurrency: int = 0, timeout: float = 0, overflow: str = 'queue'):
+        '''
+        为触发器设置并发限制与执行超时, 优先于插件的设置
+        * `overflow`: 达到并发上限时 `queue` 排队等待, `shed` 直接丢弃
+        '''
+        self.limiter = Limiter.new(max_concurrency, timeout, overflow)
+        return self
+
+    def excute(self, func: Callable|None = None, pre_excute: Iterable[Callable]|None = None, cache_ttl: float = 0, cache_size: int = 256, cache_key: Iterable[str] = ()) -> Callable:
+        '''
+        ## 添加执行函数
+        * `cache_ttl`大于`0`时缓存函数的返回值, 返回值(`Message`, `str`或`CQcode`)会被发送
+        * 缓存以`current_result`和`cache_key`中的事件字段(如`group_id`)为键, 最多保留`cache_size`项
+        * 使用缓存的函数应当只通过返回值回复, 而不是调用`send`或`done`
+        * 缓存会保存到快照中, 重启后恢复
+        '''
         def wrap(func):
-            self._append_executor(func, pre_excute)
+            cache = None
+            if cache_ttl > 0:
+                cache = ResultCache(cache_ttl, cache_size, cache_key)
+            self._append_executor(func, pre_excute, cache)
             return func
         if func is not None:
             return wrap(func)
         else:
             return wrap
 
-    def _append_executor(self, func, pre_excute):
-        executor = Executor.new(func, pre_excute)
+    def _append_executor(self, func, pre_excute, cache: ResultCache|None = None):
+        executor = Executor.new(func, pre_excute, cache)
         self.executors.append(executor)
 
     async def _check(self, event: Event):
         bot = current_bot.get()
         if not isinstance(event, self.event):
             return
-        if not await self.condition(bot, event):
-            return
-        if not await self.detector(bot, event):
-            return
+        with tracer.span('check', trigger=self._instance_name):
+            with tracer.span('condition'):
+                if not await self.condition.check(bot, event):
+                    return
+            with tracer.span('detector'):
+                if not await self.detector(bot, event):
+                    return
+            if self.condition.stateful:
+                with tracer.span('stateful_condition'):
+                    if not await self.condition.consume(bot, event):
+                        return
         current_event.set(event)
         
         return True
@@ -61,9 +96,15 @@ class Trigger:
         for executor in self.executors:
             if executor.validate(self, bot, event, result):
                 try:
-                    await executor(self, bot, event, result)
+                    with tracer.span('executor', func=executor.func.__qualname__):
+                        message = await executor(self, bot, event, result)
                 except ExecuteDone:
                     break
+                if executor.cache is not None and message is not None:
+                    await self.send(message)
+
+    def _dispose(self):
+        '''触发器被替换时调用, 用于移除其在共享索引中的记录'''
 
     @classmethod
     def _new(cls, detector: Callable[..., bool], event: Type[Event] = Event, condition: Condition|None = None, priority: int = 1, block: bool = False):
@@ -91,14 +132,7 @@ class Trigger:
         
         response = await bot.send_msg(**params)
         if recall_after > 0:
-            message_id = response['message_id']
-            async def delete():
-                await asyncio.sleep(recall_after)
-                try:
-                    await bot.delete_msg(message_id=message_id)
-                except:
-                    pass
-            asyncio.get_running_loop().create_task(delete(), name=message_id)
+            bot.scheduler.schedule('muzi.recall', delay=recall_after, kwargs={'message_id': response['message_id']}, persist=True)
 
     async def done(self, message: Message|str|CQcode|None = None, at_sender: bool = False, recall_after: int = 0) -> NoReturn:
         '''发送消息，并中止触发器执行后续操作'''
@@ -106,6 +140,24 @@ class Trigger:
             await self.send(message, at_sender, recall_after)
         raise ExecuteDone
 
+    async def receive(self, timeout: float = 60, event: Type[Event] = MessageEvent) -> Event|None:
+        '''
+        等待同一会话 (bot, 群, 用户) 中的下一个事件, 超时返回`None`
+        * 收到的事件会成为当前事件, 之后的`send`将回复该事件
+        '''
+        bot = current_bot.get()
+        key = session_key(current_event.get())
+        future = bot.sessions.wait(key, event)
+        try:
+            next_event = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            bot.sessions.discard(key, future)
+        if next_event is not None:
+            current_event.set(next_event)
+        return next_event
+
     async def call_api(self, name, **kwargs):
         bot = current_bot.get()
 
@@ -120,6 +172,113 @@ def on_event(event: Type[Event], condition: Condition|None = None, priority: int
     return Trigger._new(detector, event, condition, priority, block)
 
 
+class CommandTrigger(Trigger):
+
+    __slots__ = ('commands',)
+
+    def _dispose(self):
+        for command, entry in self.commands:
+            _command_trie.remove(command, entry)
+
+
+def _match_command(event: MessageEvent) -> tuple[int, list]:
+    '''消息匹配的最长命令的长度与对应的触发器, 命令之后需要空白的触发器不满足时跳过'''
+    if (cached := _command_match.get(None)) is not None and cached[0] is event:
+        return cached[1]
+    text = event.raw_message
+    match_ = (0, [])
+    for length, entries in _command_trie.match(text):
+        at_boundary = length == len(text) or text[length].isspace()
+        if entries := [entry for entry in entries if at_boundary or not entry[3]]:
+            match_ = (length, entries)
+            break
+    _command_match.set((event, match_))
+    return match_
+
+def _is_word_char(char: str) -> bool:
+    return char.isascii() and (char.isalnum() or char == '_')
+
+def on_command(command: str, aliases: Iterable[str] = (), prefixes: Iterable[str]|None = None, condition: Condition|None = None, priority: int = 1, block: bool = False, force_whitespace: bool|None = None):
+    '''
+    ## 命令触发器
+    * 所有命令注册在同一棵前缀树中, 每个事件只需查找一次; 有多个命令匹配时使用最长的一个
+    * `prefixes`: 命令前缀, 缺省时使用`extra_config.command_prefixes`
+    * `force_whitespace`: 命令后是否必须是空白或消息结尾, 缺省时只对以字母, 数字或下划线结尾的命令要求, 如`/roll`不会匹配`/rollercoaster`
+    * 匹配数据: `command` 命令名, `prefix` 前缀, `args` 以空白分割的参数, `argument` 参数原文
+    '''
+    if prefixes is None:
+        bot = current_bot.get(None)
+        prefixes = bot.config.extra_config['command_prefixes'] if bot else ['/']
+    def detector(e: MessageEvent):
+        length, entries = _match_command(e)
+        for trigger_, name, prefix, _ in entries:
+            if trigger_ is trigger:
+                argument = e.raw_message[length:].strip()
+                current_result.set({'command': name, 'prefix': prefix, 'args': argument.split(), 'argument': argument})
+                return True
+        return False
+    trigger = CommandTrigger._new(detector, MessageEvent, condition, priority, block)
+    trigger.commands = []
+    for name in (command, *aliases):
+        boundary = force_whitespace if force_whitespace is not None else _is_word_char(name[-1:])
+        for prefix in prefixes:
+            entry = (trigger, name, prefix, boundary)
+            _command_trie.insert(prefix+name, entry)
+            trigger.commands.append((prefix+name, entry))
+    return trigger
+
+
+class KeywordTrigger(Trigger):
+
+    __slots__ = ('keywords', 'automaton', 'file')
+
+    def set_keywords(self, keywords: Iterable[str]|dict[str, Any]):
+        '''替换关键词, 新的自动机构建完成后才会生效'''
+        keywords = keywords if isinstance(keywords, dict) else dict.fromkeys(keywords)
+        automaton = AhoCorasick(keywords)
+        self.keywords, self.automaton = keywords, automaton
+
+    def add_keywords(self, keywords: Iterable[str]|dict[str, Any]):
+        self.set_keywords({**self.keywords, **(keywords if isinstance(keywords, dict) else dict.fromkeys(keywords))})
+
+    def remove_keywords(self, keywords: Iterable[str]):
+        removed = set(keywords)
+        self.set_keywords({k: v for k, v in self.keywords.items() if k not in removed})
+
+    async def load_keywords(self):
+        '''在线程中重新读取关键词文件并构建自动机'''
+        if self.file is None:
+            return
+        await asyncio.to_thread(self.set_keywords, _read_keywords(self.file))
+
+
+def _read_keywords(file: Path) -> list[str]|dict[str, Any]:
+    with open(file, 'r', encoding='UTF-8') as f:
+        return json.load(f)
+
+def on_keyword(keywords: Iterable[str]|dict[str, Any]|None = None, file: str|None = None, condition: Condition|None = None, priority: int = 1, block: bool = False):
+    '''
+    ## 关键词触发器
+    * 关键词构建为 Aho-Corasick 自动机, 每条消息只需扫描一次
+    * `keywords`: 关键词列表, 或 关键词->数据 的字典
+    * `file`: `data_path`下的 JSON 关键词文件, 内容格式同`keywords`
+    * 匹配数据: `matched_keywords` 按出现顺序去重的关键词, `keyword_data` 关键词对应的数据
+    '''
+    def detector(e: MessageEvent):
+        keywords, automaton = trigger.keywords, trigger.automaton
+        if matched := automaton.findall(e.raw_message):
+            current_result.set({'matched_keywords': matched, 'keyword_data': {k: keywords.get(k) for k in matched}})
+            return True
+        return False
+    trigger = KeywordTrigger._new(detector, MessageEvent, condition, priority, block)
+    trigger.file = None
+    if file is not None:
+        trigger.file = Path(current_bot.get().config.data_path) / file
+        keywords = _read_keywords(trigger.file) if trigger.file.exists() else keywords
+    trigger.set_keywords(keywords or ())
+    return trigger
+
+
 def on_regex(pattern: str|re.Pattern, flags: re.RegexFlag = re.S, condition: Condition|None = None, priority: int = 1, block: bool = False):
     def detector(e: MessageEvent):
         if match_ := re.search(pattern, e.raw_message, flags):
@@ -130,7 +289,9 @@ def on_regex(pattern: str|re.Pattern, flags: re.RegexFlag = re.S, condition: Con
 
 __all__ = [
     'Trigger',
+    'on_command',
     'on_event',
+    'on_keyword',
     'on_regex',
     'current_bot',
     
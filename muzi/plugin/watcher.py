@@ -0,0 +1,56 @@
+import asyncio
+import os
+from typing import TYPE_CHECKING
+
+from ..log import logger
+from .plugin import Plugin
+
+if TYPE_CHECKING:
+    from ..bot import Bot
+
+
+def _plugin_files(plugin: Plugin) -> list[str]:
+    file = getattr(plugin.module, '__file__', None)
+    if not file:
+        return []
+    if os.path.basename(file) != '__init__.py':
+        return [file]
+    files = []
+    for root, _, names in os.walk(os.path.dirname(file)):
+        files.extend(os.path.join(root, name) for name in names if name.endswith('.py'))
+    return files
+
+def _plugin_mtimes(plugins: list[Plugin]) -> dict[str, int]:
+    mtimes = {}
+    for plugin in plugins:
+        mtime = 0
+        for file in _plugin_files(plugin):
+            try:
+                mtime = max(mtime, os.stat(file).st_mtime_ns)
+            except OSError:
+                pass
+        mtimes[plugin.module_path] = mtime
+    return mtimes
+
+async def watch_plugins(bot: 'Bot', interval: float = 1.0):
+    '''
+    ## 监视插件文件, 在文件修改后热重载插件
+    * 文件状态的读取与插件的重新导入都在线程中进行, 不阻塞事件循环
+    '''
+    logger.info(f'<g>Plugin</g> watcher is running with interval <c>{interval}s</c>.')
+    last: dict[str, int] = {}
+    while True:
+        plugins = [p for p in bot.plugins if not p.lazy]
+        mtimes = await asyncio.to_thread(_plugin_mtimes, plugins)
+        for plugin in plugins:
+            mtime = mtimes.get(plugin.module_path, 0)
+            if (previous := last.get(plugin.module_path)) is not None and mtime > previous:
+                logger.info(f'<g>Plugin</g> [<y>{plugin.module_path}</y>] has changed, reloading.')
+                await plugin.areload()
+            last[plugin.module_path] = mtime
+        await asyncio.sleep(interval)
+
+
+__all__ = [
+    'watch_plugins',
+]
@@ -0,0 +1 @@
+'''内置插件'''
@@ -0,0 +1,17 @@
+from muzi import on_command
+from muzi.bot import Bot
+from muzi.condition import SUPERUSER
+
+__metadata__ = {
+    'name': 'memory',
+    'usage_text': '/memory 查看内存统计',
+    'hide': True,
+}
+
+memory = on_command('memory', condition=SUPERUSER, block=True)
+
+@memory.excute()
+async def _(bot: Bot):
+    if bot.memory is None:
+        await memory.done('内存统计未启用, 请在 extra_config 中设置 memory_monitor')
+    await memory.done(await bot.memory.format_report())
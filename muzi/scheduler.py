@@ -0,0 +1,313 @@
+import asyncio
+import heapq
+import inspect
+import itertools
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Iterable
+from uuid import uuid4
+
+from .log import logger
+from .storage import Namespace
+from .utils import add_disposer, get_exception_local
+
+
+class Cron:
+    '''
+    cron 表达式, 依次为 `分 时 日 月 周`
+    * 支持 `*`, `*/n`, `a-b`, `a-b/n`, `a,b`
+    * 周的取值为 0-7, 0 与 7 均表示周日
+    '''
+
+    __slots__ = ('expr', 'minutes', 'hours', 'days', 'months', 'weekdays', '_any_day', '_any_weekday')
+
+    RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expr: str):
+        fields = expr.split()
+        if len(fields) != 5:
+            raise ValueError(f'cron expression must have 5 fields, got {expr!r}')
+        self.expr = expr
+        self.minutes, self.hours, self.days, self.months, weekdays = (self._parse(f, *r) for f, r in zip(fields, self.RANGES))
+        self.weekdays = frozenset(d % 7 for d in weekdays)
+        self._any_day = fields[2] == '*'
+        self._any_weekday = fields[4] == '*'
+
+    @staticmethod
+    def _parse(field: str, low: int, high: int) -> frozenset[int]:
+        values = set()
+        for part in field.split(','):
+            step = 1
+            if '/' in part:
+                part, step_ = part.split('/', 1)
+                step = int(step_)
+            if part == '*':
+                start, end = low, high
+            elif '-' in part:
+                start, end = map(int, part.split('-', 1))
+            else:
+                start = int(part)
+                end = high if step > 1 else start
+            if not low <= start <= end <= high or step < 1:
+                raise ValueError(f'invalid cron field {field!r}')
+            values.update(range(start, end+1, step))
+        return frozenset(values)
+
+    def _match_day(self, t: datetime) -> bool:
+        day = t.day in self.days
+        weekday = (t.weekday()+1) % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next(self, after: float) -> float:
+        '''返回`after`之后的下一个触发时间戳'''
+        t = datetime.fromtimestamp(after).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t + timedelta(days=366*5)
+        while t < limit:
+            if t.month not in self.months:
+                t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._match_day(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t.timestamp()
+        raise ValueError(f'cron expression {self.expr!r} never matches')
+
+
+class Job:
+    '''计划任务'''
+
+    __slots__ = ('id', 'func', 'args', 'kwargs', 'next_run', 'interval', 'cron', 'persist', 'cancelled', '_scheduler')
+
+    def __init__(self, scheduler: 'Scheduler', id: str, func: Callable|str, args: tuple, kwargs: dict, next_run: float, interval: float = 0, cron: Cron|None = None, persist: bool = False):
+        self._scheduler = scheduler
+        self.id = id
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.next_run = next_run
+        self.interval = interval
+        self.cron = cron
+        self.persist = persist
+        self.cancelled = False
+
+    def cancel(self):
+        '''取消任务'''
+        self._scheduler.cancel(self)
+
+    def dump(self) -> dict:
+        return {'handler': self.func, 'args': list(self.args), 'kwargs': self.kwargs, 'next_run': self.next_run, 'interval': self.interval, 'cron': self.cron.expr if self.cron else None}
+
+
+class Scheduler:
+    '''
+    计划任务调度器
+    * 所有任务保存在一个按触发时间排序的堆中, 由单个定时器驱动
+    * `persist=True`的任务会被保存到存储中, 重启后恢复; 这类任务需要使用`handler`注册的函数
+    '''
+
+    def __init__(self, storage: Namespace|None = None):
+        self._storage = storage
+        self._heap: list[tuple[float, int, Job]] = []
+        self._jobs: dict[str, Job] = {}
+        self._handlers: dict[str, Callable] = {}
+        self._handler_names: dict[Callable, str] = {}
+        self._counter = itertools.count()
+        self._timer: asyncio.TimerHandle|None = None
+        self._armed_at = 0.0
+        self._loop: asyncio.AbstractEventLoop|None = None
+
+    @property
+    def jobs(self) -> list[Job]:
+        return list(self._jobs.values())
+
+    def handler(self, name: str|None = None):
+        '''注册一个可以被持久化任务调用的函数'''
+        def wrap(func: Callable):
+            handler_name = name or f'{func.__module__}.{func.__qualname__}'
+            self._handlers[handler_name] = func
+            self._handler_names[func] = handler_name
+            return func
+        return wrap
+
+    def schedule(self, func: Callable|str, *, delay: float|None = None, at: float|datetime|None = None, interval: float = 0, cron: str|None = None, args: Iterable = (), kwargs: dict|None = None, persist: bool = False, id: str|None = None) -> Job:
+        '''
+        ## 创建计划任务
+        * `delay`/`at`: 首次执行的时间, 缺省时周期任务在一个周期后执行
+        * `interval`: 周期任务的间隔(秒)
+        * `cron`: cron 表达式, 见`Cron`
+        * `persist`: 是否持久化
+        '''
+        now = time.time()
+        cron_ = Cron(cron) if cron else None
+        if isinstance(at, datetime):
+            at = at.timestamp()
+        if at is not None:
+            next_run = at
+        elif delay is not None:
+            next_run = now + delay
+        elif cron_:
+            next_run = cron_.next(now)
+        else:
+            next_run = now + interval
+        if persist and not isinstance(func, str):
+            if func not in self._handler_names:
+                raise ValueError(f'{func!r} must be registered with Scheduler.handler to be persisted')
+            func = self._handler_names[func]
+        job = Job(self, id or uuid4().hex, func, tuple(args), kwargs or {}, next_run, interval, cron_, persist)
+        if self._loop is not None and not self._in_loop():
+            self._loop.call_soon_threadsafe(self._add, job)
+        else:
+            self._add(job)
+        add_disposer(job.cancel)
+        return job
+
+    def _add(self, job: Job):
+        if job.id in self._jobs:
+            self._jobs[job.id].cancel()
+        self._jobs[job.id] = job
+        self._push(job)
+        if job.persist:
+            self._save(job)
+
+    def call_later(self, delay: float, func: Callable|str, *args, **kwargs) -> Job:
+        return self.schedule(func, delay=delay, args=args, kwargs=kwargs)
+
+    def call_every(self, interval: float, func: Callable|str, *args, **kwargs) -> Job:
+        return self.schedule(func, interval=interval, args=args, kwargs=kwargs)
+
+    def call_cron(self, cron: str, func: Callable|str, *args, **kwargs) -> Job:
+        return self.schedule(func, cron=cron, args=args, kwargs=kwargs)
+
+    def cancel(self, job: Job|str):
+        '''取消任务'''
+        job_ = self._jobs.get(job) if isinstance(job, str) else job
+        if job_ is None:
+            return
+        job_.cancelled = True
+        if self._jobs.get(job_.id) is job_:
+            del self._jobs[job_.id]
+            if job_.persist:
+                self._delete(job_)
+
+    async def start(self):
+        '''启动调度器'''
+        self._loop = asyncio.get_running_loop()
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = None
+        self._armed_at = 0.0
+        for job in self._jobs.values():
+            if job.persist:
+                self._save(job)
+        self._arm()
+
+    async def restore(self):
+        '''从存储中恢复持久化的任务'''
+        if self._storage is None:
+            return
+        count = 0
+        for id, data in (await self._storage.items()).items():
+            if id in self._jobs:
+                continue
+            cron = Cron(data['cron']) if data.get('cron') else None
+            job = Job(self, id, data['handler'], tuple(data['args']), data['kwargs'], data['next_run'], data['interval'], cron, True)
+            self._jobs[id] = job
+            self._push(job)
+            count += 1
+        if count:
+            logger.info(f'<y>Scheduler</y> restored <c>{count}</c> jobs.')
+
+    def _push(self, job: Job):
+        heapq.heappush(self._heap, (job.next_run, next(self._counter), job))
+        self._arm()
+
+    def _arm(self):
+        heap = self._heap
+        while heap and (heap[0][2].cancelled or heap[0][2].next_run != heap[0][0]):
+            heapq.heappop(heap)
+        if not heap:
+            return
+        when = heap[0][0]
+        if self._timer is not None:
+            if self._armed_at <= when:
+                return
+            self._timer.cancel()
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._timer = None
+            return
+        self._timer = loop.call_later(max(0.0, when - time.time()), self._fire)
+        self._armed_at = when
+
+    def _fire(self):
+        self._timer = None
+        now = time.time()
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            when, _, job = heapq.heappop(heap)
+            if job.cancelled or job.next_run != when:
+                continue
+            asyncio.create_task(self._run(job))
+            if job.interval > 0:
+                job.next_run = when + job.interval
+                if job.next_run <= now:
+                    job.next_run = now + job.interval
+            elif job.cron:
+                job.next_run = job.cron.next(now)
+            else:
+                self._jobs.pop(job.id, None)
+                if job.persist:
+                    self._delete(job)
+                continue
+            heapq.heappush(heap, (job.next_run, next(self._counter), job))
+            if job.persist:
+                self._save(job)
+        self._arm()
+
+    async def _run(self, job: Job):
+        func = self._handlers.get(job.func) if isinstance(job.func, str) else job.func
+        if func is None:
+            logger.warning(f'<y>Scheduler</y> handler [<c>{job.func}</c>] of job [<c>{job.id}</c>] is not registered.')
+            return
+        try:
+            result = func(*job.args, **job.kwargs)
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            local = '\n'.join(get_exception_local(e))
+            logger.info(f'<y>Scheduler</y> job [<c>{job.id}</c>] <r>catch an exception.</r>\n{local}\n<r>{e}</r>')
+
+    def _save(self, job: Job):
+        if self._storage is not None and self._loop_running():
+            self._storage.set_nowait(job.id, job.dump())
+
+    def _delete(self, job: Job):
+        if self._storage is not None and self._loop_running():
+            self._storage.delete_nowait(job.id)
+
+    def _in_loop(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    @staticmethod
+    def _loop_running() -> bool:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+        return True
+
+
+__all__ = [
+    'Cron',
+    'Job',
+    'Scheduler',
+]
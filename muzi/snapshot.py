@@ -0,0 +1,114 @@
+import json
+import mmap
+import os
+import pickle
+import struct
+import time
+from typing import Any, Callable
+
+from .log import logger
+
+MAGIC = b'MUZISNAP\x01'
+HEADER = struct.Struct('<dI')
+
+
+class Snapshot:
+    '''
+    运行时状态快照
+    * 通过`register`登记状态的导出与恢复函数, 关闭时所有状态被序列化到`path`
+    * 启动时只读取文件头部的索引, 每项状态在登记时才从内存映射中反序列化
+    * 超过`max_age`秒的快照会被忽略
+    * `enabled`为`False`时既不读取也不保存快照, `register`仍然可以调用
+    '''
+
+    def __init__(self, path: str, max_age: float = 3600, enabled: bool = True):
+        self.path = path
+        self.max_age = max_age
+        self.enabled = enabled
+        self._entries: dict[str, tuple[Callable[[], Any], Callable[[Any], Any]]] = {}
+        self._index: dict[str, tuple[int, int]] = {}
+        self._file = None
+        self._mmap: mmap.mmap|None = None
+        if enabled:
+            self._open()
+
+    def register(self, name: str, dump: Callable[[], Any], load: Callable[[Any], Any]):
+        '''
+        登记一项状态
+        * `dump`返回可以被 pickle 的数据, `load`接收该数据并恢复状态
+        * 快照中存在同名的数据时立即调用`load`
+        '''
+        self._entries[name] = (dump, load)
+        if (location := self._index.pop(name, None)) is None or self._mmap is None:
+            return
+        offset, length = location
+        try:
+            load(pickle.loads(self._mmap[offset:offset+length]))
+        except Exception as e:
+            logger.warning(f'<y>Snapshot</y> <r>failed to restore</r> [<c>{name}</c>]\n<r>{e}</r>')
+        if not self._index:
+            self._close()
+
+    def unregister(self, name: str):
+        self._entries.pop(name, None)
+
+    def save(self):
+        '''序列化所有登记的状态'''
+        self._close()
+        if not self.enabled:
+            return
+        blobs: list[tuple[str, bytes]] = []
+        for name, (dump, _) in self._entries.items():
+            try:
+                blobs.append((name, pickle.dumps(dump(), pickle.HIGHEST_PROTOCOL)))
+            except Exception as e:
+                logger.warning(f'<y>Snapshot</y> <r>failed to save</r> [<c>{name}</c>]\n<r>{e}</r>')
+        index, offset = {}, 0
+        for name, blob in blobs:
+            index[name] = (offset, len(blob))
+            offset += len(blob)
+        index_bytes = json.dumps(index).encode()
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(MAGIC)
+            f.write(HEADER.pack(time.time(), len(index_bytes)))
+            f.write(index_bytes)
+            for _, blob in blobs:
+                f.write(blob)
+        os.replace(tmp, self.path)
+        logger.info(f'<y>Snapshot</y> saved <c>{len(blobs)}</c> entries (<c>{offset/1024:.1f}</c>KiB).')
+
+    async def close(self):
+        self.save()
+
+    def _open(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < len(MAGIC) + HEADER.size:
+            return
+        self._file = open(self.path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if self._mmap[:len(MAGIC)] != MAGIC:
+                raise ValueError('invalid snapshot header')
+            saved_at, length = HEADER.unpack_from(self._mmap, len(MAGIC))
+            if time.time() - saved_at > self.max_age:
+                raise ValueError(f'snapshot is {time.time() - saved_at:.0f}s old')
+            start = len(MAGIC) + HEADER.size
+            index = json.loads(self._mmap[start:start+length])
+            self._index = {name: (start + length + offset, size) for name, (offset, size) in index.items()}
+        except Exception as e:
+            logger.info(f'<y>Snapshot</y> [<c>{self.path}</c>] is ignored: {e}')
+            self._close()
+
+    def _close(self):
+        self._index = {}
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+__all__ = [
+    'Snapshot',
+]
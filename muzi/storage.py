@@ -0,0 +1,209 @@
+import asyncio
+import json
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any
+
+from .log import logger
+
+if TYPE_CHECKING:
+    import sqlite3
+
+_DELETED = object()
+_MISSING = object()
+
+class Storage:
+    '''
+    异步键值存储
+    * 数据保存在 WAL 模式的 SQLite 数据库中, 所有 I/O 都在独立线程中执行
+    * 写入先进入缓冲区, 每隔`commit_interval`秒合并为一次事务提交
+    * 读取优先命中内存缓存, 缓存以 LRU 方式保留最多`cache_size`项
+    * 值需要可以被 JSON 序列化, 读取到的值不应被原地修改
+    * `close`之后再次使用时会重新打开数据库
+    '''
+
+    def __init__(self, path: str, commit_interval: float = 0.05, cache_size: int = 4096):
+        self.path = path
+        self.commit_interval = commit_interval
+        self.cache_size = cache_size
+        self._executor: ThreadPoolExecutor|None = None
+        self._connection: 'sqlite3.Connection|None' = None
+        self._cache: OrderedDict[tuple[str, str], Any] = OrderedDict()
+        self._pending: dict[tuple[str, str], Any] = {}
+        self._committing: dict[tuple[str, str], Any] = {}
+        self._commit_future: asyncio.Future|None = None
+        self._commit_lock = asyncio.Lock()
+
+    def namespace(self, name: str) -> 'Namespace':
+        '''获取一个命名空间, 通常每个插件使用一个'''
+        return Namespace(self, name)
+
+    async def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        k = (namespace, key)
+        value = self._lookup(k)
+        if value is _MISSING:
+            raw = await self._run(self._select, namespace, key)
+            if (value := self._lookup(k)) is _MISSING:
+                value = _DELETED if raw is None else json.loads(raw)
+                self._cache_put(k, value)
+        return default if value is _DELETED else value
+
+    def set_nowait(self, namespace: str, key: str, value: Any) -> asyncio.Future:
+        '''写入缓冲区并立即返回, 返回的 Future 在写入提交后完成'''
+        k = (namespace, key)
+        self._pending[k] = json.dumps(value, ensure_ascii=False)
+        self._cache_put(k, value)
+        return self._schedule_commit()
+
+    def delete_nowait(self, namespace: str, key: str) -> asyncio.Future:
+        k = (namespace, key)
+        self._pending[k] = _DELETED
+        self._cache_put(k, _DELETED)
+        return self._schedule_commit()
+
+    async def set(self, namespace: str, key: str, value: Any):
+        '''写入并等待提交完成'''
+        await asyncio.shield(self.set_nowait(namespace, key, value))
+
+    async def delete(self, namespace: str, key: str):
+        await asyncio.shield(self.delete_nowait(namespace, key))
+
+    async def items(self, namespace: str) -> dict[str, Any]:
+        rows = await self._run(self._select_all, namespace)
+        items = {key: json.loads(raw) for key, raw in rows}
+        for buffer in (self._committing, self._pending):
+            for (ns, key), raw in buffer.items():
+                if ns != namespace:
+                    continue
+                if raw is _DELETED:
+                    items.pop(key, None)
+                else:
+                    items[key] = json.loads(raw)
+        return items
+
+    async def flush(self):
+        '''立即提交缓冲区中的写入'''
+        while self._commit_future is not None:
+            await asyncio.shield(self._commit_future)
+        async with self._commit_lock:
+            pass
+
+    async def close(self):
+        await self.flush()
+        await self._run(self._close)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self._commit_lock = asyncio.Lock()
+
+    def _lookup(self, k: tuple[str, str]) -> Any:
+        if k in self._cache:
+            self._cache.move_to_end(k)
+            return self._cache[k]
+        for buffer in (self._pending, self._committing):
+            if k in buffer:
+                raw = buffer[k]
+                return _DELETED if raw is _DELETED else json.loads(raw)
+        return _MISSING
+
+    def _cache_put(self, k: tuple[str, str], value: Any):
+        self._cache[k] = value
+        self._cache.move_to_end(k)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _schedule_commit(self) -> asyncio.Future:
+        if self._commit_future is None:
+            self._commit_future = asyncio.get_running_loop().create_future()
+            self._commit_future.add_done_callback(self._report)
+            asyncio.create_task(self._commit(self._commit_future))
+        return self._commit_future
+
+    async def _commit(self, future: asyncio.Future):
+        await asyncio.sleep(self.commit_interval)
+        async with self._commit_lock:
+            self._committing, self._pending = self._pending, {}
+            self._commit_future = None
+            try:
+                await self._run(self._write, self._committing)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(None)
+            finally:
+                self._committing = {}
+
+    def _report(self, future: asyncio.Future):
+        if not future.cancelled() and (e := future.exception()) is not None:
+            logger.error(f'<y>Storage</y> [<c>{self.path}</c>] <r>failed to commit writes.</r>\n<r>{e}</r>')
+
+    async def _run(self, func, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='muzi-storage')
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _connect(self) -> 'sqlite3.Connection':
+        if self._connection is None:
+            import sqlite3
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS kv (namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, PRIMARY KEY (namespace, key)) WITHOUT ROWID')
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+    def _close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _select(self, namespace: str, key: str) -> str|None:
+        row = self._connect().execute('SELECT value FROM kv WHERE namespace = ? AND key = ?', (namespace, key)).fetchone()
+        return row[0] if row else None
+
+    def _select_all(self, namespace: str) -> list[tuple[str, str]]:
+        return self._connect().execute('SELECT key, value FROM kv WHERE namespace = ?', (namespace,)).fetchall()
+
+    def _write(self, batch: dict[tuple[str, str], Any]):
+        connection = self._connect()
+        with connection:
+            connection.executemany('INSERT OR REPLACE INTO kv (namespace, key, value) VALUES (?, ?, ?)', [(ns, key, raw) for (ns, key), raw in batch.items() if raw is not _DELETED])
+            connection.executemany('DELETE FROM kv WHERE namespace = ? AND key = ?', [k for k, raw in batch.items() if raw is _DELETED])
+
+
+class Namespace:
+    '''存储中的一个命名空间'''
+
+    __slots__ = ('storage', 'name')
+
+    def __init__(self, storage: Storage, name: str):
+        self.storage = storage
+        self.name = name
+
+    async def get(self, key: str, default: Any = None) -> Any:
+        return await self.storage.get(self.name, key, default)
+
+    async def set(self, key: str, value: Any):
+        await self.storage.set(self.name, key, value)
+
+    async def delete(self, key: str):
+        await self.storage.delete(self.name, key)
+
+    def set_nowait(self, key: str, value: Any) -> asyncio.Future:
+        return self.storage.set_nowait(self.name, key, value)
+
+    def delete_nowait(self, key: str) -> asyncio.Future:
+        return self.storage.delete_nowait(self.name, key)
+
+    async def items(self) -> dict[str, Any]:
+        return await self.storage.items(self.name)
+
+    async def keys(self) -> list[str]:
+        return list((await self.items()).keys())
+
+
+__all__ = [
+    'Namespace',
+    'Storage',
+]
@@ -0,0 +1,220 @@
+import asyncio
+import json
+import os
+import random
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from contextvars import ContextVar
+from pathlib import Path
+
+from .exception import ExecuteDone
+from .log import logger
+
+current_span: ContextVar['Span|None'] = ContextVar('current_span', default=None)
+
+_NOOP = nullcontext()
+
+
+class Span:
+    '''
+    一段计时的操作
+    * 同一事件产生的所有 span 共享`trace_id`, 根 span 结束时整条 trace 被导出
+    * 可以作为上下文管理器使用, 进入时成为当前 span
+    '''
+
+    __slots__ = ('tracer', 'trace_id', 'span_id', 'parent', 'name', 'attributes', 'start', 'duration', '_spans', '_counter', '_begin', '_token')
+
+    def __init__(self, tracer: 'Tracer', name: str, parent: 'Span|None' = None, start: float|None = None, **attributes):
+        self.tracer = tracer
+        self.name = name
+        self.parent = parent
+        self.attributes = attributes
+        self.duration: float|None = None
+        self._begin = time.perf_counter() if start is None else start
+        self.start = time.time() - (time.perf_counter() - self._begin)
+        self._token = None
+        if parent is None:
+            self.trace_id = os.urandom(8).hex()
+            self.span_id = 0
+            self._spans: list[Span] = []
+            self._counter = 1
+        else:
+            root = parent.root
+            self.trace_id = root.trace_id
+            self.span_id = root._counter
+            root._counter += 1
+
+    @property
+    def root(self) -> 'Span':
+        span = self
+        while span.parent is not None:
+            span = span.parent
+        return span
+
+    def child(self, name: str, **attributes) -> 'Span':
+        return Span(self.tracer, name, self, **attributes)
+
+    def record(self, name: str, start: float, end: float, **attributes) -> 'Span':
+        '''补记一段已经结束的子操作, `start`与`end`为`time.perf_counter()`的值'''
+        span = Span(self.tracer, name, self, start, **attributes)
+        span._close(end - start)
+        return span
+
+    def finish(self, **attributes):
+        if self.duration is not None:
+            return
+        self.attributes.update(attributes)
+        self._close(time.perf_counter() - self._begin)
+
+    def _close(self, duration: float):
+        self.duration = duration
+        root = self.root
+        if root is self:
+            self._spans.append(self)
+            self.tracer._export(self._spans)
+            self._spans = []
+        elif root.duration is None:
+            root._spans.append(self)
+        else:
+            self.tracer._export([self])
+
+    def dump(self) -> dict:
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent.span_id if self.parent is not None else None,
+            'name': self.name,
+            'start': self.start,
+            'duration': self.duration,
+            'attributes': self.attributes,
+        }
+
+    def __enter__(self):
+        self._token = current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._token is not None:
+            current_span.reset(self._token)
+            self._token = None
+        if exc_type is not None and not issubclass(exc_type, (asyncio.CancelledError, ExecuteDone)):
+            self.attributes['error'] = repr(exc)
+        self.finish()
+
+
+class Exporter(ABC):
+    '''trace 导出器, `export`在线程中调用'''
+
+    @abstractmethod
+    def export(self, spans: list[dict]): ...
+
+
+class FileExporter(Exporter):
+    '''
+    以 JSON Lines 格式写入文件, 每行一个 span
+    * 文件超过`max_bytes`时轮转, 保留`backups`个旧文件
+    '''
+
+    def __init__(self, path: str, max_bytes: int = 10485760, backups: int = 3):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+
+    def export(self, spans: list[dict]):
+        if self.path.exists() and self.path.stat().st_size >= self.max_bytes:
+            self._rotate()
+        with open(self.path, 'a', encoding='UTF-8') as f:
+            f.writelines(json.dumps(span, ensure_ascii=False, default=str) + '\n' for span in spans)
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            src = self.path.with_name(f'{self.path.name}.{i}')
+            if src.exists():
+                src.replace(self.path.with_name(f'{self.path.name}.{i+1}'))
+        if self.backups > 0:
+            self.path.replace(self.path.with_name(f'{self.path.name}.1'))
+        else:
+            self.path.unlink()
+
+
+class Tracer:
+    '''
+    事件追踪
+    * 每个事件以`sample_rate`的概率被采样, 未采样的事件不会产生任何 span
+    * 结束的 trace 每隔`flush_interval`秒批量交给`exporter`
+    '''
+
+    def __init__(self, exporter: Exporter|None = None, sample_rate: float = 0.0, flush_interval: float = 1.0):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.flush_interval = flush_interval
+        self._buffer: list[dict] = []
+        self._flush_handle: asyncio.TimerHandle|None = None
+        self._executor: ThreadPoolExecutor|None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0 and self.exporter is not None
+
+    def start_trace(self, name: str, start: float|None = None, **attributes) -> Span|None:
+        '''按采样率创建根 span, 未采样时返回`None`'''
+        if not self.enabled or random.random() >= self.sample_rate:
+            return None
+        return Span(self, name, None, start, **attributes)
+
+    def span(self, name: str, **attributes):
+        '''当前处于采样的 trace 中时创建子 span, 否则返回空的上下文管理器'''
+        if (parent := current_span.get()) is None:
+            return _NOOP
+        return parent.child(name, **attributes)
+
+    def _export(self, spans: list['Span']):
+        self._buffer.extend(span.dump() for span in spans)
+        if self._flush_handle is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                return self.flush()
+            self._flush_handle = loop.call_later(self.flush_interval, self._schedule_flush)
+
+    def _schedule_flush(self):
+        self._flush_handle = None
+        batch, self._buffer = self._buffer, []
+        if batch and self.exporter is not None:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='muzi-trace')
+            asyncio.get_running_loop().run_in_executor(self._executor, self._write, self.exporter, batch)
+
+    def flush(self):
+        '''同步导出缓冲区中的 span'''
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._buffer = self._buffer, []
+        if batch and self.exporter is not None:
+            self._write(self.exporter, batch)
+
+    @staticmethod
+    def _write(exporter: Exporter, batch: list[dict]):
+        try:
+            exporter.export(batch)
+        except Exception as e:
+            logger.error(f'<y>Tracer</y> <r>failed to export {len(batch)} spans.</r>\n<r>{e}</r>')
+
+
+tracer = Tracer()
+
+
+__all__ = [
+    'Exporter',
+    'FileExporter',
+    'Span',
+    'Tracer',
+    'current_span',
+    'tracer',
+]
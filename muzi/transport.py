@@ -0,0 +1,154 @@
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Mapping
+
+from .exception import ConnectionClosed
+
+if TYPE_CHECKING:
+    from starlette.websockets import WebSocket
+    from websockets.asyncio.server import ServerConnection
+
+Receive = Callable[[], Awaitable[dict]]
+Send = Callable[[dict], Awaitable[None]]
+
+
+class Transport(ABC):
+    '''
+    与 OneBot 实现之间的 websocket 连接
+    * `receive` 在连接断开时抛出`ConnectionClosed`
+    '''
+
+    __slots__ = ()
+
+    @property
+    @abstractmethod
+    def headers(self) -> Mapping[str, str]: ...
+
+    async def accept(self):
+        pass
+
+    @abstractmethod
+    async def receive(self) -> str|bytes: ...
+
+    @abstractmethod
+    async def send(self, text: str): ...
+
+    @abstractmethod
+    async def close(self): ...
+
+
+class StarletteTransport(Transport):
+    '''FastAPI/Starlette 的 websocket 路由'''
+
+    __slots__ = ('websocket',)
+
+    def __init__(self, websocket: 'WebSocket'):
+        self.websocket = websocket
+
+    @property
+    def headers(self):
+        return self.websocket.headers
+
+    async def accept(self):
+        await self.websocket.accept()
+
+    async def receive(self):
+        message = await self.websocket.receive()
+        if message['type'] == 'websocket.disconnect':
+            raise ConnectionClosed(message.get('code'))
+        return message.get('text') or message.get('bytes') or ''
+
+    async def send(self, text: str):
+        await self.websocket.send({'type': 'websocket.send', 'text': text})
+
+    async def close(self):
+        await self.websocket.close()
+
+
+class ASGITransport(Transport):
+    '''直接使用 ASGI 消息, 不经过 Starlette'''
+
+    __slots__ = ('scope', '_receive', '_send', '_headers')
+
+    def __init__(self, scope: dict, receive: Receive, send: Send):
+        self.scope = scope
+        self._receive = receive
+        self._send = send
+        self._headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope.get('headers', ())}
+
+    @property
+    def headers(self):
+        return self._headers
+
+    async def accept(self):
+        message = await self._receive()
+        if message['type'] != 'websocket.connect':
+            raise ConnectionClosed(message.get('code'))
+        await self._send({'type': 'websocket.accept'})
+
+    async def receive(self):
+        message = await self._receive()
+        if message['type'] == 'websocket.disconnect':
+            raise ConnectionClosed(message.get('code'))
+        return message.get('text') or message.get('bytes') or ''
+
+    async def send(self, text: str):
+        await self._send({'type': 'websocket.send', 'text': text})
+
+    async def close(self):
+        await self._send({'type': 'websocket.close', 'code': 1000})
+
+
+class WebsocketsTransport(Transport):
+    '''`websockets`库的连接'''
+
+    __slots__ = ('connection',)
+
+    def __init__(self, connection: 'ServerConnection'):
+        self.connection = connection
+
+    @property
+    def headers(self):
+        return self.connection.request.headers # type: ignore
+
+    async def receive(self):
+        from websockets.exceptions import ConnectionClosed as _ConnectionClosed
+        try:
+            return await self.connection.recv()
+        except _ConnectionClosed as e:
+            raise ConnectionClosed(e.rcvd.code if e.rcvd else None)
+
+    async def send(self, text: str):
+        await self.connection.send(text)
+
+    async def close(self):
+        await self.connection.close()
+
+
+class ASGIApp:
+    '''
+    精简的 ASGI 应用
+    * websocket 路径上的连接直接交给 bot 处理
+    * 其余请求(包括 lifespan)交给 FastAPI 应用
+    '''
+
+    __slots__ = ('path', 'handler', 'fallback')
+
+    def __init__(self, path: str, handler: Callable[[Transport], Awaitable[Any]], fallback: Callable[[], Any]):
+        self.path = path
+        self.handler = handler
+        self.fallback = fallback
+
+    async def __call__(self, scope: dict, receive: Receive, send: Send):
+        if scope['type'] == 'websocket' and scope['path'] == self.path:
+            await self.handler(ASGITransport(scope, receive, send))
+        else:
+            await self.fallback()(scope, receive, send)
+
+
+__all__ = [
+    'ASGIApp',
+    'ASGITransport',
+    'StarletteTransport',
+    'Transport',
+    'WebsocketsTransport',
+]
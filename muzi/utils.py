@@ -1,4 +1,13 @@
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
 from types import TracebackType
+from typing import Any, Callable, Hashable
+
+_MISSING = object()
+
+_disposers: ContextVar[list[Callable]|None] = ContextVar('_disposers', default=None)
 
 
 def get_exception_local(e: Exception):
@@ -11,3 +20,77 @@ def get_exception_local(e: Exception):
             tb_next(tb.tb_next)
     tb_next(e.__traceback__) # type: ignore
     return local
+
+def add_disposer(func: Callable):
+    '''插件导入期间登记一个撤销操作(如移除注册的钩子), 插件重载时调用'''
+    if (disposers := _disposers.get()) is not None:
+        disposers.append(func)
+
+@contextmanager
+def collect_disposers(disposers: list[Callable]):
+    '''收集期间通过`add_disposer`登记的撤销操作'''
+    token = _disposers.set(disposers)
+    try:
+        yield disposers
+    finally:
+        _disposers.reset(token)
+
+
+class LRUCache:
+    '''
+    容量与存活时间有界的 LRU 缓存
+    * `maxsize`: 最大条目数, 超出时淘汰最久未使用的条目
+    * `ttl`: 默认存活时间(秒), `0` 表示不过期
+    '''
+
+    __slots__ = ('maxsize', 'ttl', '_data')
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key: Hashable):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        if (item := self._data.get(key)) is None:
+            return default
+        expire, value = item
+        if expire and expire < time.time():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float|None = None):
+        ttl = self.ttl if ttl is None else ttl
+        self._data[key] = (time.time() + ttl if ttl > 0 else 0, value)
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        if (item := self._data.pop(key, None)) is None:
+            return default
+        return item[1]
+
+    def clear(self):
+        self._data.clear()
+
+    def dump(self) -> list[tuple[Hashable, float, Any]]:
+        '''导出未过期的条目, 按最近使用排序'''
+        now = time.time()
+        return [(key, expire, value) for key, (expire, value) in self._data.items() if not expire or expire >= now]
+
+    def load(self, items: list[tuple[Hashable, float, Any]]):
+        now = time.time()
+        for key, expire, value in items:
+            if not expire or expire >= now:
+                self._data[key] = (expire, value)
+                self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
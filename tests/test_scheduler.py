@@ -0,0 +1,83 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from muzi.scheduler import Cron, Scheduler
+
+
+def next_fire(expr: str, after: datetime) -> datetime:
+    return datetime.fromtimestamp(Cron(expr).next(after.timestamp()))
+
+
+def test_parse_fields():
+    cron = Cron('*/15 9-17 * 1,6 1-5')
+    assert cron.minutes == {0, 15, 30, 45}
+    assert cron.hours == set(range(9, 18))
+    assert cron.days == set(range(1, 32))
+    assert cron.months == {1, 6}
+    assert cron.weekdays == {1, 2, 3, 4, 5}
+
+
+def test_parse_step_from_start():
+    assert Cron('5/20 * * * *').minutes == {5, 25, 45}
+    assert Cron('0 0-12/6 * * *').hours == {0, 6, 12}
+
+
+def test_sunday_is_0_and_7():
+    assert Cron('0 0 * * 7').weekdays == {0}
+    assert Cron('0 0 * * 0,7').weekdays == {0}
+
+
+@pytest.mark.parametrize('expr', ['* * * *', '60 * * * *', '* 24 * * *', '* * 0 * *', '* * * 13 *', '*/0 * * * *', '5-1 * * * *'])
+def test_parse_invalid(expr):
+    with pytest.raises(ValueError):
+        Cron(expr)
+
+
+def test_next_same_day():
+    assert next_fire('30 9 * * *', datetime(2024, 1, 1, 9, 29, 59)) == datetime(2024, 1, 1, 9, 30)
+
+
+def test_next_is_strictly_after():
+    assert next_fire('30 9 * * *', datetime(2024, 1, 1, 9, 30)) == datetime(2024, 1, 2, 9, 30)
+
+
+def test_next_rolls_over_month_and_year():
+    assert next_fire('0 0 1 * *', datetime(2024, 1, 15)) == datetime(2024, 2, 1)
+    assert next_fire('0 0 1 1 *', datetime(2024, 12, 31, 23, 59)) == datetime(2025, 1, 1)
+
+
+def test_next_day_or_weekday():
+    # 日与周都被限制时满足其一即可, 2024-09-01 是周日
+    assert next_fire('0 0 13 * 5', datetime(2024, 9, 1)) == datetime(2024, 9, 6)
+    assert next_fire('0 0 13 * 5', datetime(2024, 9, 12)) == datetime(2024, 9, 13)
+
+
+def test_next_day_and_wildcard_weekday():
+    assert next_fire('0 12 * * 1', datetime(2024, 9, 1)) == datetime(2024, 9, 2, 12)
+
+
+def test_next_leap_day():
+    assert next_fire('0 0 29 2 *', datetime(2023, 3, 1)) == datetime(2024, 2, 29)
+
+
+def test_next_never_matches():
+    with pytest.raises(ValueError):
+        Cron('0 0 31 2 *').next(datetime(2024, 1, 1).timestamp())
+
+
+def test_restart_rearms_timer():
+    scheduler = Scheduler()
+    fired = []
+    scheduler.call_every(0.01, fired.append, 1)
+
+    async def run():
+        await scheduler.start()
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+    first = len(fired)
+    asyncio.run(run())
+    assert first > 0
+    assert len(fired) > first